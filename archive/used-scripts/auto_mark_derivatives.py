@@ -17,13 +17,36 @@ Strategy:
 4. Auto-resolve groups where all rejected photos are clearly derivatives
 """
 
-import re
 import sqlite3
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from operator import itemgetter
 from pathlib import Path
 
 DB_PATH = Path("organized/photos.db")
 
+# A group member; path_lower and resolution (width * height) are computed once at load
+Photo = namedtuple(
+    "Photo",
+    [
+        "photo_id",
+        "quality_score",
+        "width",
+        "height",
+        "file_size",
+        "path",
+        "original_path",
+        "path_lower",
+        "resolution",
+    ],
+)
+
+
+def resolution(row) -> int:
+    """Pixel count of a row with width and height."""
+    return row["width"] * row["height"]
+
 
 def extract_base_filename(path: str) -> str:
     """
@@ -35,52 +58,60 @@ def extract_base_filename(path: str) -> str:
     """
     filename = Path(path).stem  # Remove extension
 
-    # Remove ONLY observed prefixes
-    filename = re.sub(r"^thumb_", "", filename, flags=re.IGNORECASE)
+    # Remove ONLY observed prefixes (case-insensitive)
+    if filename[:6].lower() == "thumb_":
+        filename = filename[6:]
 
     # Remove ONLY observed suffixes
-    filename = re.sub(r"_1024$", "", filename)
+    if filename.endswith("_1024"):
+        filename = filename[:-5]
 
     return filename.upper()  # Normalize case
 
 
-def is_derivative_path(path: str) -> bool:
+def is_derivative_path(path_lower: str) -> bool:
     """
-    Check if path indicates this is a derivative/thumbnail.
+    Check if (lower-cased) path indicates this is a derivative/thumbnail.
 
     Based on observed data: "Thumbnails" appeared 43 times, all others rare.
     """
-    path_lower = path.lower()
-
     # ONLY the most reliable indicator from our data
     return "/thumbnails/" in path_lower or "/thumb_" in path_lower
 
 
-def is_modern_photos_library(path: str) -> bool:
+def is_modern_photos_library(path_lower: str) -> bool:
     """
-    Check if path is from the modern macOS Photos Library.
+    Check if (lower-cased) path is from the modern macOS Photos Library.
 
     Photos libraries use .photoslibrary extension (plural).
     This includes "Photos Library.photoslibrary", "Rose's photo library.photoslibrary",
     and any other custom-named Photos libraries.
     """
-    path_lower = path.lower()
     return ".photoslibrary/" in path_lower
 
 
-def is_iphoto_library(path: str) -> bool:
+def is_iphoto_library(path_lower: str) -> bool:
     """
-    Check if path is from iPhoto Library.
+    Check if (lower-cased) path is from iPhoto Library.
 
     iPhoto libraries use .photolibrary extension (singular).
     """
-    path_lower = path.lower()
     return ".photolibrary/" in path_lower
 
 
-def analyze_group(conn, group_id: int) -> dict:
+def library_preference(path_lower: str) -> int:
+    """Rank of a photo's library when choosing a keeper: higher is preferred."""
+    if is_modern_photos_library(path_lower):
+        return 2
+    if is_iphoto_library(path_lower):
+        return 0
+    return 1
+
+
+def analyze_group(photos: list[Photo]) -> dict:
     """
-    Analyze a duplicate group to determine if it can be auto-resolved.
+    Analyze a duplicate group's photos (best quality_score first) to determine
+    if it can be auto-resolved.
 
     Returns:
         {
@@ -90,33 +121,13 @@ def analyze_group(conn, group_id: int) -> dict:
             'reason': str
         }
     """
-    cursor = conn.execute(
-        """
-        SELECT
-            dg.photo_id,
-            dg.quality_score,
-            dg.width,
-            dg.height,
-            dg.file_size,
-            p.path,
-            p.original_path
-        FROM duplicate_groups dg
-        JOIN photos p ON dg.photo_id = p.id
-        WHERE dg.group_id = ?
-        ORDER BY dg.quality_score DESC
-    """,
-        (group_id,),
-    )
-
-    photos = [dict(row) for row in cursor.fetchall()]
-
     if not photos:
         return {"can_auto_resolve": False, "reason": "Empty group"}
 
     # Group by base filename
     filename_clusters = defaultdict(list)
     for photo in photos:
-        base_name = extract_base_filename(photo["original_path"])
+        base_name = extract_base_filename(photo.original_path)
         filename_clusters[base_name].append(photo)
 
     # Check if we can auto-resolve
@@ -126,85 +137,60 @@ def analyze_group(conn, group_id: int) -> dict:
     for base_name, cluster in filename_clusters.items():
         if len(cluster) == 1:
             # Only one photo with this base name - keep it
-            suggested_keepers.append(cluster[0]["photo_id"])
+            suggested_keepers.append(cluster[0].photo_id)
             continue
 
         # Multiple versions of the same base filename
         # Sort by quality score, then by file size (larger is better)
-        cluster.sort(key=lambda x: (x["quality_score"], x["file_size"]), reverse=True)
+        cluster.sort(key=lambda x: (x.quality_score, x.file_size), reverse=True)
 
         # Find the max resolution in this cluster
-        max_resolution = cluster[0]["width"] * cluster[0]["height"]
+        max_resolution = cluster[0].resolution
 
         # Get all photos at max resolution
         max_res_photos = [
-            p for p in cluster if p["width"] * p["height"] == max_resolution
+            p for p in cluster if p.resolution == max_resolution
         ]
 
-        # If there are multiple photos at max resolution, prefer Photos Library over iPhoto, then largest file
-        if len(max_res_photos) > 1:
-            # Separate modern Photos Library from iPhoto Library and others
-            modern_photos = [
-                p
-                for p in max_res_photos
-                if is_modern_photos_library(p["original_path"])
-            ]
-            iphoto_lib = [
-                p for p in max_res_photos if is_iphoto_library(p["original_path"])
-            ]
-            other = [
-                p
-                for p in max_res_photos
-                if not is_modern_photos_library(p["original_path"])
-                and not is_iphoto_library(p["original_path"])
-            ]
-
-            # Prefer modern Photos Library, then other libraries, then iPhoto Library (as last resort)
-            # Within each category, prefer larger file size
-            if modern_photos:
-                modern_photos.sort(key=lambda x: x["file_size"], reverse=True)
-                best = modern_photos[0]
-            elif other:
-                other.sort(key=lambda x: x["file_size"], reverse=True)
-                best = other[0]
-            else:
-                iphoto_lib.sort(key=lambda x: x["file_size"], reverse=True)
-                best = iphoto_lib[0]
-        else:
-            best = max_res_photos[0]
+        # If there are multiple photos at max resolution, prefer modern Photos Library,
+        # then other libraries, then iPhoto Library (as last resort); within each
+        # category prefer larger file size. max() keeps the first of any ties.
+        best = max(
+            max_res_photos, key=lambda p: (library_preference(p.path_lower), p.file_size)
+        )
 
         # Check if lower quality versions are clearly derivatives
         derivatives_found = False
 
         for photo in cluster:
-            if photo["photo_id"] == best["photo_id"]:
+            if photo.photo_id == best.photo_id:
                 continue
 
             # Check if it's a derivative
-            if is_derivative_path(photo["original_path"]):
+            if is_derivative_path(photo.path_lower):
                 derivatives_found = True
             # Check if it's significantly smaller
             elif (
-                photo["width"] < best["width"] * 0.9
-                or photo["height"] < best["height"] * 0.9
+                photo.width < best.width * 0.9
+                or photo.height < best.height * 0.9
             ):
                 derivatives_found = True
             # Check if it's at max resolution but smaller file (likely re-encoded)
             elif (
-                photo["width"] * photo["height"] == max_resolution
-                and photo["file_size"] < best["file_size"]
+                photo.resolution == max_resolution
+                and photo.file_size < best.file_size
             ):
                 derivatives_found = True
 
         if derivatives_found:
             has_derivatives = True
             # Keep the best quality version (largest file at max resolution)
-            suggested_keepers.append(best["photo_id"])
+            suggested_keepers.append(best.photo_id)
         else:
             # Can't clearly identify derivatives - needs manual review
             # Keep all versions for manual review
             for photo in cluster:
-                suggested_keepers.append(photo["photo_id"])
+                suggested_keepers.append(photo.photo_id)
 
     # Determine if we can auto-resolve or partially resolve
     # Two modes:
@@ -222,28 +208,28 @@ def analyze_group(conn, group_id: int) -> dict:
         reason = "No photos would be rejected"
     else:
         # Check if all suggested keepers are at EXACT maximum resolution
-        keeper_photos = [p for p in photos if p["photo_id"] in suggested_keepers]
-        rejected_photos = [p for p in photos if p["photo_id"] not in suggested_keepers]
+        keeper_photos = [p for p in photos if p.photo_id in suggested_keepers]
+        rejected_photos = [p for p in photos if p.photo_id not in suggested_keepers]
 
-        max_resolution = max(p["width"] * p["height"] for p in keeper_photos)
-        min_keeper_resolution = min(p["width"] * p["height"] for p in keeper_photos)
+        max_resolution = max(p.resolution for p in keeper_photos)
+        min_keeper_resolution = min(p.resolution for p in keeper_photos)
 
         # Check for FULL auto-resolution
         if min_keeper_resolution == max_resolution:
             # Additionally verify rejected photos are clearly derivatives
             # Get max file size among keepers for comparison
-            max_keeper_file_size = max(p["file_size"] for p in keeper_photos)
+            max_keeper_file_size = max(p.file_size for p in keeper_photos)
 
             all_rejected_are_derivatives = True
             for rejected in rejected_photos:
                 is_derivative = (
-                    is_derivative_path(rejected["original_path"])
-                    or rejected["width"] * rejected["height"] < max_resolution * 0.5
+                    is_derivative_path(rejected.path_lower)
+                    or rejected.resolution < max_resolution * 0.5
                     or
                     # Also accept max-res photos with smaller file sizes (re-encoded versions)
                     (
-                        rejected["width"] * rejected["height"] == max_resolution
-                        and rejected["file_size"] < max_keeper_file_size
+                        rejected.resolution == max_resolution
+                        and rejected.file_size < max_keeper_file_size
                     )
                 )
                 if not is_derivative:
@@ -261,15 +247,15 @@ def analyze_group(conn, group_id: int) -> dict:
             # Can't fully auto-resolve, but check for PARTIAL resolution
             # Mark only OBVIOUS thumbnails/derivatives for removal
             for rejected in rejected_photos:
-                rejected_resolution = rejected["width"] * rejected["height"]
+                rejected_resolution = rejected.resolution
                 # Only mark as derivative if it's clearly a thumbnail:
                 # 1. In a thumbnail path, OR
                 # 2. Less than 50% of the MINIMUM keeper resolution (very conservative)
                 if (
-                    is_derivative_path(rejected["original_path"])
+                    is_derivative_path(rejected.path_lower)
                     or rejected_resolution < min_keeper_resolution * 0.5
                 ):
-                    partial_rejects.append(rejected["photo_id"])
+                    partial_rejects.append(rejected.photo_id)
 
             if partial_rejects:
                 can_partial_resolve = True
@@ -282,7 +268,7 @@ def analyze_group(conn, group_id: int) -> dict:
         "can_partial_resolve": can_partial_resolve,
         "partial_rejects": partial_rejects,
         "filename_clusters": {
-            k: [p["photo_id"] for p in v] for k, v in filename_clusters.items()
+            k: [p.photo_id for p in v] for k, v in filename_clusters.items()
         },
         "suggested_keepers": suggested_keepers,
         "reason": reason,
@@ -295,6 +281,11 @@ def main():
 
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-200000")  # 200MB cache
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")  # 256MB
 
     # Add auto_resolved column if it doesn't exist
     try:
@@ -307,15 +298,52 @@ def main():
         # Column already exists
         pass
 
+    # Unresolved rows for the group scan below, (group_id, photo_id) for the final UPDATE
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_dg_unresolved ON duplicate_groups(group_id)
+        WHERE auto_resolved = 0 OR auto_resolved IS NULL
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_dg_group_photo ON duplicate_groups(group_id, photo_id)"
+    )
+    conn.commit()
+
     # Get only groups that haven't been auto-resolved yet
     cursor = conn.execute("""
-        SELECT DISTINCT group_id, group_size
+        SELECT group_id, group_size
         FROM duplicate_groups
         WHERE auto_resolved = 0 OR auto_resolved IS NULL
-        ORDER BY group_id
+        GROUP BY group_id
     """)
     groups = cursor.fetchall()
 
+    # Load the photos of all those groups in one pass, best quality first
+    cursor = conn.execute("""
+        SELECT
+            dg.group_id,
+            dg.photo_id,
+            dg.quality_score,
+            dg.width,
+            dg.height,
+            dg.file_size,
+            p.path,
+            p.original_path
+        FROM duplicate_groups dg
+        JOIN photos p ON dg.photo_id = p.id
+        WHERE dg.group_id IN (
+            SELECT group_id FROM duplicate_groups
+            WHERE auto_resolved = 0 OR auto_resolved IS NULL
+        )
+        ORDER BY dg.group_id, dg.quality_score DESC
+    """)
+    photos_by_group = {
+        group_id: [
+            Photo(*row[1:], row["original_path"].lower(), resolution(row))
+            for row in rows
+        ]
+        for group_id, rows in groupby(cursor, key=itemgetter("group_id"))
+    }
+
     print(f"Analyzing {len(groups)} duplicate groups...")
     print()
 
@@ -327,46 +355,35 @@ def main():
 
     stats_by_reason = defaultdict(int)
 
-    for group in groups:
+    # (group_id, photo_id, auto_resolved, is_suggested_keeper) to apply in one UPDATE at the end
+    pending = []
+
+    # analyze_group is pure, so groups are analysed across processes;
+    # all database writes stay in this process
+    with ProcessPoolExecutor() as pool:
+        analyses = list(
+            pool.map(
+                analyze_group,
+                [photos_by_group.get(group["group_id"], []) for group in groups],
+                chunksize=64,
+            )
+        )
+
+    for group, analysis in zip(groups, analyses):
         group_id = group["group_id"]
-        analysis = analyze_group(conn, group_id)
 
         stats_by_reason[analysis["reason"]] += 1
 
         if analysis["can_auto_resolve"]:
-            # FULL auto-resolution: mark entire group as resolved
-            # First, unmark all photos in this group
-            conn.execute(
-                """
-                UPDATE duplicate_groups
-                SET is_suggested_keeper = 0, auto_resolved = 0
-                WHERE group_id = ?
-            """,
-                (group_id,),
-            )
-
-            # Mark suggested keepers
-            if analysis["suggested_keepers"]:
-                placeholders = ",".join("?" * len(analysis["suggested_keepers"]))
-                conn.execute(
-                    f"""
-                    UPDATE duplicate_groups
-                    SET is_suggested_keeper = 1, auto_resolved = 1
-                    WHERE group_id = ? AND photo_id IN ({placeholders})
-                """,
-                    [group_id] + analysis["suggested_keepers"],
+            # FULL auto-resolution: mark entire group as resolved,
+            # with only the suggested keepers marked as keepers
+            keepers = set(analysis["suggested_keepers"])
+            for photo_ids in analysis["filename_clusters"].values():
+                pending.extend(
+                    (group_id, photo_id, 1, int(photo_id in keepers))
+                    for photo_id in photo_ids
                 )
 
-            # Mark non-keepers as auto-resolved too
-            conn.execute(
-                """
-                UPDATE duplicate_groups
-                SET auto_resolved = 1
-                WHERE group_id = ? AND is_suggested_keeper = 0
-            """,
-                (group_id,),
-            )
-
             auto_resolved_count += 1
             num_rejected = group["group_size"] - len(analysis["suggested_keepers"])
             total_derivatives_rejected += num_rejected
@@ -374,16 +391,9 @@ def main():
         elif analysis["can_partial_resolve"]:
             # PARTIAL resolution: mark only obvious derivatives as resolved
             # Keepers remain unmarked (auto_resolved = 0) for manual review
-            if analysis["partial_rejects"]:
-                placeholders = ",".join("?" * len(analysis["partial_rejects"]))
-                conn.execute(
-                    f"""
-                    UPDATE duplicate_groups
-                    SET auto_resolved = 1, is_suggested_keeper = 0
-                    WHERE group_id = ? AND photo_id IN ({placeholders})
-                """,
-                    [group_id] + analysis["partial_rejects"],
-                )
+            pending.extend(
+                (group_id, photo_id, 1, 0) for photo_id in analysis["partial_rejects"]
+            )
 
             partial_resolved_count += 1
             total_partial_derivatives_rejected += len(analysis["partial_rejects"])
@@ -392,6 +402,25 @@ def main():
         else:
             manual_review_count += 1
 
+    conn.execute("""
+        CREATE TEMP TABLE pending_resolve (
+            group_id INTEGER,
+            photo_id TEXT,
+            auto_resolved INTEGER,
+            is_suggested_keeper INTEGER,
+            PRIMARY KEY (group_id, photo_id)
+        )
+    """)
+    conn.executemany("INSERT INTO pending_resolve VALUES (?, ?, ?, ?)", pending)
+    conn.execute("""
+        UPDATE duplicate_groups
+        SET auto_resolved = pr.auto_resolved,
+            is_suggested_keeper = pr.is_suggested_keeper
+        FROM pending_resolve pr
+        WHERE duplicate_groups.group_id = pr.group_id
+          AND duplicate_groups.photo_id = pr.photo_id
+    """)
+    conn.execute("DROP TABLE pending_resolve")
     conn.commit()
 
     # Print summary
@@ -435,7 +464,7 @@ def main():
         WHERE dg.auto_resolved = 1
         GROUP BY dg.group_id
         HAVING keepers > 0
-        ORDER BY rejected DESC
+        ORDER BY rejected DESC, dg.group_id
         LIMIT 10
     """)
 
@@ -443,20 +472,26 @@ def main():
     if examples:
         print(f"{'Group':<10} {'Total':<8} {'Kept':<8} {'Rejected':<10} Example")
         print("-" * 80)
-        for ex in examples:
-            # Get an example keeper filename
-            keeper = conn.execute(
-                """
-                SELECT p.original_path
+
+        # One example keeper path per example group
+        group_ids = [ex["group_id"] for ex in examples]
+        placeholders = ",".join("?" * len(group_ids))
+        keeper_paths = dict(
+            conn.execute(
+                f"""
+                SELECT dg.group_id, MIN(p.original_path)
                 FROM duplicate_groups dg
                 JOIN photos p ON dg.photo_id = p.id
-                WHERE dg.group_id = ? AND dg.is_suggested_keeper = 1
-                LIMIT 1
+                WHERE dg.group_id IN ({placeholders}) AND dg.is_suggested_keeper = 1
+                GROUP BY dg.group_id
             """,
-                (ex["group_id"],),
-            ).fetchone()
+                group_ids,
+            ).fetchall()
+        )
 
-            filename = Path(keeper["original_path"]).name if keeper else "N/A"
+        for ex in examples:
+            keeper_path = keeper_paths.get(ex["group_id"])
+            filename = Path(keeper_path).name if keeper_path else "N/A"
             print(
                 f"{ex['group_id']:<10} {ex['total_photos']:<8} {ex['keepers']:<8} {ex['rejected']:<10} {filename}"
             )
@@ -1,12 +1,14 @@
 #!/usr/bin/env -S uv run --script
 # /// script
 # requires-python = '>=3.13'
-# dependencies = ['pillow']
+# dependencies = ['pillow', 'numpy']
 # ///
 """Compare two images to find differences."""
 
 import hashlib
 import sys
+
+import numpy as np
 from PIL import Image
 
 path1 = sys.argv[1]
@@ -18,19 +20,26 @@ img2 = Image.open(path2)
 print(f"Image 1: {img1.size}, mode={img1.mode}")
 print(f"Image 2: {img2.size}, mode={img2.mode}")
 
-# Compare pixel data
-pixels1 = list(img1.getdata())
-pixels2 = list(img2.getdata())
+# Compare raw pixel data
+data1 = img1.tobytes()
+data2 = img2.tobytes()
 
-if pixels1 == pixels2:
+if data1 == data2:
     print("\nPixel data is IDENTICAL")
 else:
-    diffs = sum(1 for p1, p2 in zip(pixels1, pixels2) if p1 != p2)
+    # One row per pixel, one column per band
+    pixels1 = np.asarray(img1).reshape(img1.width * img1.height, -1)
+    pixels2 = np.asarray(img2).reshape(img2.width * img2.height, -1)
+    n = min(len(pixels1), len(pixels2))
+    if pixels1.shape[1] != pixels2.shape[1]:
+        diffs = n
+    else:
+        diffs = int(np.any(pixels1[:n] != pixels2[:n], axis=1).sum())
     print(f"\nPixel differences: {diffs} pixels differ out of {len(pixels1)}")
 
 # Hash just the pixel data
-img1_hash = hashlib.md5(img1.tobytes()).hexdigest()
-img2_hash = hashlib.md5(img2.tobytes()).hexdigest()
+img1_hash = hashlib.blake2b(data1, digest_size=16).hexdigest()
+img2_hash = hashlib.blake2b(data2, digest_size=16).hexdigest()
 print(f"\nPixel data hash 1: {img1_hash}")
 print(f"Pixel data hash 2: {img2_hash}")
 
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 # /// script
+# requires-python = '>=3.10'
 # dependencies = ["tqdm"]
 # ///
 """
@@ -26,8 +27,7 @@ HAMMING_THRESHOLD = 8  # Maximum hamming distance to consider duplicates
 
 def hamming_distance(hash1: str, hash2: str) -> int:
     """Calculate hamming distance between two hex hash strings."""
-    xor = int(hash1, 16) ^ int(hash2, 16)
-    return bin(xor).count('1')
+    return (int(hash1, 16) ^ int(hash2, 16)).bit_count()
 
 class UnionFind:
     """Union-Find data structure for grouping connected duplicates."""
@@ -10,8 +10,10 @@ to organized/filtered/{reason}/ subdirectories. Files are moved (not copied)
 to save space, and database records are kept for potential restoration.
 """
 
+import shutil
 import sqlite3
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from tqdm import tqdm
 
@@ -19,6 +21,15 @@ DB_PATH = Path("organized/photos.db")
 OUTPUT_ROOT = Path("organized")
 IMAGES_DIR = OUTPUT_ROOT / "images"
 FILTERED_DIR = OUTPUT_ROOT / "filtered"
+MOVE_THREADS = 16
+
+def move_file(source_path, dest_path):
+    """Move one file, copying across filesystems if needed; returns the error, if any."""
+    try:
+        shutil.move(source_path, dest_path)
+    except Exception as e:
+        return e
+    return None
 
 def main():
     if not DB_PATH.exists():
@@ -55,16 +66,15 @@ def main():
     error_count = 0
     already_moved = 0
     moved_by_reason = {}
+    created_dirs = set()
+    path_updates = []
 
-    for photo_id, path, reason, confidence_score in tqdm(photos, desc="Moving files"):
+    # (photo_id, reason, source_path, dest_path) for every file to move
+    moves = []
+    for photo_id, path, reason, confidence_score in photos:
         # Path in database is relative to organized/ directory
         source_path = OUTPUT_ROOT / path
 
-        if not source_path.exists():
-            # Already moved or deleted
-            already_moved += 1
-            continue
-
         # Build destination path: organized/filtered/{reason}/{confidence}/
         # Keep the confidence subdirectory structure
         confidence_bucket = (
@@ -74,31 +84,41 @@ def main():
         )
 
         dest_dir = FILTERED_DIR / reason / confidence_bucket
-        dest_dir.mkdir(parents=True, exist_ok=True)
-
-        dest_path = dest_dir / source_path.name
-
-        try:
-            # Move the file
-            source_path.rename(dest_path)
-
-            # Update database with new path (relative to organized/)
-            relative_path = dest_path.relative_to(OUTPUT_ROOT)
-            conn.execute("""
-                UPDATE photos
-                SET path = ?
-                WHERE id = ?
-            """, (str(relative_path), photo_id))
+        if dest_dir not in created_dirs:
+            dest_dir.mkdir(parents=True, exist_ok=True)
+            created_dirs.add(dest_dir)
+
+        moves.append((photo_id, reason, source_path, dest_dir / source_path.name))
+
+    # Moves are I/O-bound and release the GIL, so overlap them on threads;
+    # counting and database updates stay on this thread
+    with ThreadPoolExecutor(max_workers=MOVE_THREADS) as pool:
+        errors = pool.map(move_file, [m[2] for m in moves], [m[3] for m in moves])
+
+        for (photo_id, reason, source_path, dest_path), error in tqdm(
+            zip(moves, errors), total=len(moves), desc="Moving files"
+        ):
+            if isinstance(error, FileNotFoundError):
+                # Already moved or deleted
+                already_moved += 1
+                continue
+            if error is not None:
+                print(f"\nError moving {source_path}: {error}")
+                error_count += 1
+                continue
+
+            # New path (relative to organized/) for the database
+            path_updates.append((str(dest_path.relative_to(OUTPUT_ROOT)), photo_id))
 
             moved_count += 1
             moved_by_reason[reason] = moved_by_reason.get(reason, 0) + 1
 
-        except Exception as e:
-            print(f"\nError moving {source_path}: {e}")
-            error_count += 1
-            continue
-
-    # Commit all database updates
+    # Apply all database updates
+    conn.executemany("""
+        UPDATE photos
+        SET path = ?
+        WHERE id = ?
+    """, path_updates)
     conn.commit()
 
     print(f"\n{'='*70}")
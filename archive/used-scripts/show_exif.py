@@ -7,12 +7,19 @@
 
 import sys
 from PIL import Image
-from PIL.ExifTags import TAGS, GPSTAGS
+from PIL.ExifTags import IFD, TAGS, GPSTAGS
 
 for path in sys.argv[1:]:
     print(f"=== {path.split('/')[-1]} ===")
     img = Image.open(path)
-    exif_data = img._getexif()
+    exif = img.getexif()
+
+    # IFD0 plus the Exif sub-IFD, with GPSInfo expanded; MakerNote stays
+    # an unparsed blob
+    exif_data = dict(exif)
+    exif_data.update(exif.get_ifd(IFD.Exif))
+    if IFD.GPSInfo in exif:
+        exif_data[IFD.GPSInfo] = exif.get_ifd(IFD.GPSInfo)
 
     if exif_data:
         for tag_id, value in sorted(exif_data.items()):
@@ -3,19 +3,83 @@
 Quick validation tool to spot-check photo recovery results
 """
 
+import io
+import random
+import shutil
 import sqlite3
 import subprocess
 import sys
+from contextlib import redirect_stdout
+from os.path import basename
 from pathlib import Path
 
 DB_PATH = Path("organized/photos.db")
 
+# Set once the session's path search index has been built
+_search_index_built = False
+
+# (data_version, rendered text) of the last statistics report
+_stats_cache = None
+
+# xdg-open (Linux) or open (Mac), whichever is installed
+OPENER = shutil.which('xdg-open') or shutil.which('open')
+
+# Indexes the menu queries use, by name. Confidence ranges are sampled from
+# the first without touching the table; the grouped statistics scan the others
+INDEXES = {
+    'idx_photos_confidence_path':
+        "CREATE INDEX IF NOT EXISTS idx_photos_confidence_path ON photos(confidence_score, original_path)",
+    'idx_photos_date_source':
+        "CREATE INDEX IF NOT EXISTS idx_photos_date_source ON photos(date_source)",
+    'idx_photos_camera_full': """
+        CREATE INDEX IF NOT EXISTS idx_photos_camera_full
+        ON photos(camera_make || ' ' || camera_model) WHERE camera_make IS NOT NULL
+    """,
+    'idx_photos_perceptual_hash':
+        "CREATE INDEX IF NOT EXISTS idx_photos_perceptual_hash ON photos(perceptual_hash)",
+}
+
+def indexes_ready(conn):
+    """Whether every index in INDEXES exists and photos has been analyzed"""
+    names = {name for name, in conn.execute("SELECT name FROM sqlite_master")}
+    if not INDEXES.keys() <= names or 'sqlite_stat1' not in names:
+        return False
+    # A partial index with no matching rows gets no stat1 row of its own
+    return conn.execute(
+        "SELECT 1 FROM sqlite_stat1 WHERE tbl = 'photos' LIMIT 1"
+    ).fetchone() is not None
+
+def create_indexes():
+    """Create any missing indexes and their planner statistics.
+
+    Best effort: if the database is locked by a writer or can't be written,
+    the menu still works without the indexes, only slower.
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=0)
+    try:
+        for sql in INDEXES.values():
+            conn.execute(sql)
+        # Sampled statistics so the planner costs those indexes properly
+        conn.execute("PRAGMA analysis_limit=1000")
+        conn.execute("ANALYZE photos")
+    except sqlite3.OperationalError as e:
+        print(f"Warning: couldn't create indexes ({e}), continuing without them")
+    finally:
+        conn.close()
+
 def main():
     if not DB_PATH.exists():
         print(f"Error: Database not found at {DB_PATH}")
         sys.exit(1)
 
-    conn = sqlite3.connect(DB_PATH)
+    # The session itself only reads, so open read-only; a write connection
+    # is opened only if the indexes still need creating
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    if not indexes_ready(conn):
+        create_indexes()
+    conn.execute("PRAGMA mmap_size=268435456")  # 256MB, skips read() copies
+    conn.execute("PRAGMA cache_size=-65536")  # 64MB cache
+    conn.execute("PRAGMA temp_store=MEMORY")
 
     print("Photo Recovery Validation Tool")
     print("=" * 60)
@@ -50,35 +114,77 @@ def main():
         elif choice == '6':
             open_random_photo(conn)
 
+def random_rowids(conn, min_score, max_score, limit):
+    """Up to `limit` random rowids of photos scored min_score-max_score, in random order"""
+    cursor = conn.execute("""
+        SELECT rowid FROM photos
+        WHERE confidence_score BETWEEN ? AND ?
+    """, (min_score, max_score))
+    rowids = [rowid for rowid, in cursor]
+    return random.sample(rowids, min(limit, len(rowids)))
+
+def fetch_by_rowids(conn, columns, rowids):
+    """Rows of the given columns for rowids, in the same order"""
+    placeholders = ",".join("?" * len(rowids))
+    cursor = conn.execute(f"""
+        SELECT rowid, {columns} FROM photos
+        WHERE rowid IN ({placeholders})
+    """, rowids)
+    rows = {row[0]: row[1:] for row in cursor}
+    return [rows[rowid] for rowid in rowids]
+
 def show_samples(conn, min_score=0, max_score=100, limit=20):
     """Show sample photos from a confidence range"""
-    cursor = conn.execute(f"""
-        SELECT original_path, confidence_score, camera_make, camera_model,
-               date_taken, date_source, width, height, is_thumbnail
-        FROM photos
-        WHERE confidence_score >= {min_score} AND confidence_score <= {max_score}
-        ORDER BY RANDOM()
-        LIMIT {limit}
-    """)
+    rowids = random_rowids(conn, min_score, max_score, limit)
+    rows = fetch_by_rowids(conn, """
+        original_path, confidence_score, camera_make, camera_model,
+        date_taken, date_source, width, height, is_thumbnail
+    """, rowids)
 
     print(f"\n{limit} Random samples (score {min_score}-{max_score}):")
     print("-" * 60)
 
-    for row in cursor:
+    # One write for the whole batch rather than a flushed line at a time
+    lines = []
+    for row in rows:
         path, score, make, model, date, date_src, w, h, thumb = row
         camera = f"{make} {model}" if make and model else "No camera info"
-        print(f"\nScore {score}: {Path(path).name}")
-        print(f"  Path: {path}")
-        print(f"  Camera: {camera}")
-        print(f"  Date: {date} (source: {date_src})")
-        print(f"  Size: {w}x{h}, Thumbnail: {thumb}")
+        lines += [
+            f"\nScore {score}: {basename(path)}",
+            f"  Path: {path}",
+            f"  Camera: {camera}",
+            f"  Date: {date} (source: {date_src})",
+            f"  Size: {w}x{h}, Thumbnail: {thumb}",
+        ]
+    if lines:
+        print("\n".join(lines))
+
+def ensure_search_index(conn):
+    """Build a trigram full-text index of paths for this session, on first use"""
+    global _search_index_built
+    if not _search_index_built:
+        # In the temp schema, so the database itself is never modified
+        conn.execute("""
+            CREATE VIRTUAL TABLE temp.photos_search
+            USING fts5(original_path, tokenize='trigram')
+        """)
+        conn.execute("""
+            INSERT INTO temp.photos_search(rowid, original_path)
+            SELECT rowid, original_path FROM photos
+        """)
+        _search_index_built = True
 
 def search_photos(conn, search_term):
     """Search for photos by path"""
+    # The trigram index answers substring LIKE patterns without scanning
+    # every path (terms under three characters still scan it)
+    ensure_search_index(conn)
     cursor = conn.execute("""
         SELECT original_path, confidence_score, camera_make, camera_model, date_taken
         FROM photos
-        WHERE original_path LIKE ?
+        WHERE rowid IN (
+            SELECT rowid FROM photos_search WHERE original_path LIKE ?
+        )
         ORDER BY confidence_score DESC
         LIMIT 50
     """, (f'%{search_term}%',))
@@ -91,54 +197,72 @@ def search_photos(conn, search_term):
     print(f"\nFound {len(results)} photos matching '{search_term}':")
     print("-" * 60)
 
+    lines = []
     for path, score, make, model, date in results:
         camera = f"{make} {model}" if make and model else "No camera"
-        print(f"Score {score}: {Path(path).name} - {camera}")
+        lines.append(f"Score {score}: {basename(path)} - {camera}")
+    print("\n".join(lines))
 
 def show_statistics(conn):
-    """Show detailed statistics"""
+    """Show detailed statistics, reusing the last report until the database changes"""
+    global _stats_cache
+    # data_version changes only when another connection commits a write
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if _stats_cache is None or _stats_cache[0] != version:
+        report = io.StringIO()
+        with redirect_stdout(report):
+            print_statistics(conn)
+        _stats_cache = (version, report.getvalue())
+    print(_stats_cache[1], end="")
+
+def print_statistics(conn):
+    """Print detailed statistics"""
     print("\n" + "=" * 60)
     print("STATISTICS")
     print("=" * 60)
 
-    # Total
-    cursor = conn.execute("SELECT COUNT(*) FROM photos")
-    total = cursor.fetchone()[0]
-    print(f"\nTotal photos: {total}")
-
-    # By confidence
-    print("\nConfidence breakdown:")
-    cursor = conn.execute("""
+    # Total and confidence buckets from a per-score histogram, which is read
+    # off the confidence index; the bucket CASE then runs once per distinct
+    # score rather than once per photo
+    breakdown = conn.execute("""
         SELECT
             CASE
                 WHEN confidence_score >= 70 THEN 'High (>= 70)'
                 WHEN confidence_score >= 40 THEN 'Medium (40-69)'
                 ELSE 'Low (< 40)'
             END as bucket,
-            COUNT(*),
-            ROUND(AVG(confidence_score), 1),
+            SUM(n),
+            ROUND(1.0 * SUM(confidence_score * n)
+                  / SUM(CASE WHEN confidence_score IS NOT NULL THEN n END), 1) as avg_score,
             MIN(confidence_score),
             MAX(confidence_score)
-        FROM photos
+        FROM (
+            SELECT confidence_score, COUNT(*) as n
+            FROM photos
+            GROUP BY confidence_score
+        )
         GROUP BY bucket
-        ORDER BY AVG(confidence_score) DESC
-    """)
+        ORDER BY avg_score DESC
+    """).fetchall()
+    total = sum(b[1] for b in breakdown)
+    print(f"\nTotal photos: {total}")
 
-    for bucket, count, avg, min_s, max_s in cursor:
+    # By confidence
+    print("\nConfidence breakdown:")
+    for bucket, count, avg, min_s, max_s in breakdown:
         pct = (count / total) * 100
         print(f"  {bucket}: {count:4d} photos ({pct:5.1f}%) - avg: {avg}, range: {min_s}-{max_s}")
 
     # Date sources
     print("\nDate sources:")
     cursor = conn.execute("""
-        SELECT date_source, COUNT(*)
+        SELECT date_source, COUNT(*), 100.0 * COUNT(*) / SUM(COUNT(*)) OVER ()
         FROM photos
         GROUP BY date_source
         ORDER BY COUNT(*) DESC
     """)
 
-    for source, count in cursor:
-        pct = (count / total) * 100
+    for source, count, pct in cursor:
         print(f"  {source}: {count:4d} photos ({pct:5.1f}%)")
 
     # Cameras
@@ -155,9 +279,8 @@ def show_statistics(conn):
     for camera, count in cursor:
         print(f"  {camera}: {count} photos")
 
-    # Duplicates
-    cursor = conn.execute("SELECT COUNT(DISTINCT perceptual_hash) FROM photos")
-    unique = cursor.fetchone()[0]
+    # Duplicates, counted by walking the hash index rather than sorting every hash
+    unique = conn.execute("SELECT COUNT(DISTINCT perceptual_hash) FROM photos").fetchone()[0]
     print(f"\nUnique perceptual hashes: {unique}")
     print(f"Potential duplicates: {total - unique}")
 
@@ -175,31 +298,22 @@ def open_random_photo(conn):
         print("Invalid choice")
         return
 
-    cursor = conn.execute(f"""
-        SELECT original_path, confidence_score
-        FROM photos
-        WHERE confidence_score >= {min_score} AND confidence_score <= {max_score}
-        ORDER BY RANDOM()
-        LIMIT 1
-    """)
-
-    result = cursor.fetchone()
-    if not result:
+    rowids = random_rowids(conn, min_score, max_score, 1)
+    if not rowids:
         print("No photos in that range")
         return
 
-    path, score = result
+    [(path, score)] = fetch_by_rowids(conn, "original_path, confidence_score", rowids)
     print(f"\nOpening: {path}")
     print(f"Score: {score}")
 
-    # Try to open with xdg-open (Linux) or open (Mac)
-    try:
-        subprocess.run(['xdg-open', path], check=True)
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        try:
-            subprocess.run(['open', path], check=True)
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            print(f"\nCouldn't auto-open. Photo location: {path}")
+    if OPENER is None:
+        print(f"\nCouldn't auto-open. Photo location: {path}")
+        return
+
+    # Launch the viewer detached so the prompt comes straight back
+    subprocess.Popen([OPENER, path], stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL, start_new_session=True)
 
 if __name__ == "__main__":
     main()
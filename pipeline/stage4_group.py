@@ -393,6 +393,11 @@ def run_stage4(clear_existing: bool = False) -> None:
                 unlinked_pairs,
             )
 
+        # Index unlinked pairs in distance order, for unlinked_viewer's paging
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_unlinked_dist ON unlinked_pairs(phash_dist, dhash_dist)"
+        )
+
         conn.commit()
 
         # Calculate stats
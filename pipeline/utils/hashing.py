@@ -92,8 +92,7 @@ def hamming_distance(hash1: str, hash2: str) -> int:
 
     Lower distance = more similar images.
     """
-    xor = int(hash1, 16) ^ int(hash2, 16)
-    return bin(xor).count("1")
+    return (int(hash1, 16) ^ int(hash2, 16)).bit_count()
 
 
 # =============================================================================
@@ -226,6 +226,8 @@ def run_stage1b(clear_existing: bool = False) -> None:
         conn.execute("CREATE INDEX IF NOT EXISTS idx_pairs_colorhash ON photo_pairs(colorhash_dist)")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_pairs_same_group ON photo_pairs(same_primary_group)")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_pairs_2d ON photo_pairs(same_primary_group, phash16_dist, colorhash_dist)")
+        # Tuner's colorhash view: filter on colorhash_dist, ordered by phash16_dist
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pairs_2d_colorhash ON photo_pairs(same_primary_group, colorhash_dist, phash16_dist)")
         conn.commit()
 
         # Create summary table for fast threshold tuner queries
@@ -50,8 +50,7 @@ def get_file_path(photo_id: str, mime_type: str) -> Path:
 
 def hamming_distance(hash1: str, hash2: str) -> int:
     """Calculate hamming distance between two hex hash strings."""
-    xor = int(hash1, 16) ^ int(hash2, 16)
-    return bin(xor).count("1")
+    return (int(hash1, 16) ^ int(hash2, 16)).bit_count()
 
 
 def should_group(phash_dist: int, dhash_dist: int) -> bool:
@@ -30,7 +30,7 @@ def hamming_distance(hash1: str, hash2: str) -> int:
     try:
         h1 = int(hash1, 16)
         h2 = int(hash2, 16)
-        return bin(h1 ^ h2).count('1')
+        return (h1 ^ h2).bit_count()
     except (ValueError, TypeError):
         return 256
 
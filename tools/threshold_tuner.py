@@ -63,12 +63,6 @@ def get_file_path(photo_id: str, mime_type: str) -> Path:
     return FILES_DIR / photo_id[:2] / f"{photo_id}{ext}"
 
 
-def hamming_distance(hash1: str, hash2: str) -> int:
-    """Calculate hamming distance between two hex hash strings."""
-    xor = int(hash1, 16) ^ int(hash2, 16)
-    return bin(xor).count("1")
-
-
 def sample_pairs(hash_type: str) -> dict[int, list]:
     """
     Sample photo pairs and group by hamming distance.
@@ -107,6 +101,13 @@ def sample_pairs(hash_type: str) -> dict[int, list]:
 
     print(f"Sampled {len(photos)} photos for {hash_type} comparison")
 
+    # Parse hex hashes once, not once per pair
+    if hash_type == "compare":
+        phashes = [int(p["phash"], 16) for p in photos]
+        dhashes = [int(p["dhash"], 16) for p in photos]
+    else:
+        hashes = [int(p["hash"], 16) for p in photos]
+
     # Compute all pair distances within sample
     pairs_by_distance = defaultdict(list)
     total_pairs = 0
@@ -114,8 +115,8 @@ def sample_pairs(hash_type: str) -> dict[int, list]:
     for i in range(len(photos)):
         for j in range(i + 1, len(photos)):
             if hash_type == "compare":
-                phash_dist = hamming_distance(photos[i]["phash"], photos[j]["phash"])
-                dhash_dist = hamming_distance(photos[i]["dhash"], photos[j]["dhash"])
+                phash_dist = (phashes[i] ^ phashes[j]).bit_count()
+                dhash_dist = (dhashes[i] ^ dhashes[j]).bit_count()
                 # pHash 10-14 = border between same scene and not a match
                 # Stratify by dHash
                 if 10 <= phash_dist <= 14:
@@ -128,7 +129,7 @@ def sample_pairs(hash_type: str) -> dict[int, list]:
                     # Key by dHash distance
                     pairs_by_distance[dhash_dist].append((p1, p2))
             else:
-                dist = hamming_distance(photos[i]["hash"], photos[j]["hash"])
+                dist = (hashes[i] ^ hashes[j]).bit_count()
                 # Only keep pairs up to distance 20 (beyond that is clearly different)
                 if dist <= 20:
                     pairs_by_distance[dist].append((photos[i], photos[j]))
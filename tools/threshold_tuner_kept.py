@@ -3,6 +3,7 @@
 # requires-python = '>=3.13'
 # dependencies = [
 #   "flask",
+#   "numpy>=2.0",
 # ]
 # ///
 """
@@ -12,12 +13,18 @@ Shows pairs at each phash16 distance level, ordered by colorhash.
 Helps visualize how colorhash discriminates within phash16 levels.
 """
 
+import functools
+import gzip
+import json
+import os
 import sqlite3
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import json
-
-from flask import Flask, render_template_string, send_file, request
+import numpy as np
+from flask import Flask, jsonify, send_file, request
+from markupsafe import Markup
 
 # Paths
 DB_PATH = Path(__file__).parent.parent / "output" / "photos.db"
@@ -28,32 +35,97 @@ THRESHOLDS_FILE = Path(__file__).parent.parent / "output" / "threshold_boundarie
 app = Flask(__name__)
 
 
+def _file_version(path: Path) -> int | None:
+    """mtime token for caches of a file's contents, or None if it's missing."""
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+# (ratings file mtime, parsed ratings) - re-read only when the file changes
+_ratings_cache = None
+
 def load_ratings() -> dict:
     """Load ratings from file."""
-    if RATINGS_FILE.exists():
+    global _ratings_cache
+    version = _file_version(RATINGS_FILE)
+    if version is None:
+        return {}
+    if _ratings_cache is None or _ratings_cache[0] != version:
         with open(RATINGS_FILE) as f:
-            return json.load(f)
-    return {}
+            _ratings_cache = (version, json.load(f))
+    return _ratings_cache[1]
 
 
+# (thresholds file mtime, parsed thresholds) - re-read only when the file changes
+_thresholds_cache = None
+
 def load_thresholds() -> dict:
     """Load threshold boundaries from file."""
-    if THRESHOLDS_FILE.exists():
+    global _thresholds_cache
+    version = _file_version(THRESHOLDS_FILE)
+    if version is None:
+        return {"complete": [], "single": []}
+    if _thresholds_cache is None or _thresholds_cache[0] != version:
         with open(THRESHOLDS_FILE) as f:
-            return json.load(f)
-    return {"complete": [], "single": []}
+            _thresholds_cache = (version, json.load(f))
+    return _thresholds_cache[1]
+
+
+def _write_text(path: Path, text: str):
+    """Write via a temp file and rename, so readers never see a partial file."""
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
 
+def _write_json(path: Path, data):
+    """Atomically write data as indented JSON."""
+    _write_text(path, json.dumps(data, indent=2))
+
+
+# (thresholds file mtime, JSON text) as last written by save_thresholds
+_thresholds_written = None
 
 def save_thresholds(thresholds: dict):
-    """Save threshold boundaries to file."""
-    with open(THRESHOLDS_FILE, "w") as f:
-        json.dump(thresholds, f, indent=2)
+    """Save threshold boundaries to file, skipping writes that change nothing."""
+    global _thresholds_cache, _thresholds_written
+    text = json.dumps(thresholds, indent=2)
+    if _thresholds_written == (_file_version(THRESHOLDS_FILE), text):
+        return
+    _write_text(THRESHOLDS_FILE, text)
+    version = _file_version(THRESHOLDS_FILE)
+    _thresholds_cache = (version, thresholds)
+    _thresholds_written = (version, text)
+    # Writes can land within one mtime tick, so don't rely on the version alone
+    threshold_classes.cache_clear()
 
 
 def save_ratings(ratings: dict):
     """Save ratings to file."""
-    with open(RATINGS_FILE, "w") as f:
-        json.dump(ratings, f, indent=2)
+    global _ratings_cache, _ratings_array_cache
+    _write_json(RATINGS_FILE, ratings)
+    _ratings_cache = (_file_version(RATINGS_FILE), ratings)
+    _ratings_array_cache = None
+
+
+# (ratings file mtime, array) - rebuilt when the file changes
+_ratings_array_cache = None
+
+def get_ratings_array() -> np.ndarray:
+    """Ratings as a COUNTS_SHAPE uint8 array indexed [phash16, colorhash], 0 = unrated."""
+    global _ratings_array_cache
+    version = _file_version(RATINGS_FILE)
+    if _ratings_array_cache is None or _ratings_array_cache[0] != version:
+        ratings = np.zeros(COUNTS_SHAPE, dtype=np.uint8)
+        for key, rating in load_ratings().items():
+            p, c = map(int, key.split(','))
+            if p < COUNTS_SHAPE[0] and c < COUNTS_SHAPE[1]:
+                ratings[p, c] = rating
+        _ratings_array_cache = (version, ratings)
+    return _ratings_array_cache[1]
 
 
 def get_rating(phash16: int, colorhash: int) -> int | None:
@@ -65,10 +137,18 @@ def get_rating(phash16: int, colorhash: int) -> int | None:
 
 def set_rating(phash16: int, colorhash: int, rating: int):
     """Set rating for a coordinate."""
+    global _ratings_array_cache
     ratings = load_ratings()
+    ratings_array = get_ratings_array()
+    array_version = _ratings_array_cache[0]
     key = f"{phash16},{colorhash}"
     ratings[key] = rating
     save_ratings(ratings)
+    # Patch the one changed cell rather than rebuilding from every rating
+    if phash16 < COUNTS_SHAPE[0] and colorhash < COUNTS_SHAPE[1]:
+        ratings_array[phash16, colorhash] = rating
+    _ratings_array_cache = (_ratings_cache[0], ratings_array)
+    update_skip_row(phash16, array_version)
 
 # Map MIME types to extensions
 MIME_TO_EXT = {
@@ -83,10 +163,25 @@ MIME_TO_EXT = {
 }
 
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+_read_conn = None
+
+def get_read_connection():
+    """Query-only connection shared by all request threads.
+
+    The dev server starts a thread per request, so per-thread connections
+    would never be reused. sqlite3 serializes access to a shared handle.
+    Callers must not close it.
+    """
+    global _read_conn
+    if _read_conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = 1")
+        conn.execute("PRAGMA mmap_size = 268435456")  # 256MB, skips read() copies
+        conn.execute("PRAGMA cache_size = -65536")  # 64MB cache
+        conn.execute("PRAGMA temp_store = MEMORY")
+        _read_conn = conn
+    return _read_conn
 
 
 def get_file_path(photo_id: str, mime_type: str) -> Path:
@@ -95,10 +190,43 @@ def get_file_path(photo_id: str, mime_type: str) -> Path:
     return FILES_DIR / photo_id[:2] / f"{photo_id}{ext}"
 
 
-def hamming_distance(hash1: str, hash2: str) -> int:
-    """Calculate hamming distance between two hex hash strings."""
-    xor = int(hash1, 16) ^ int(hash2, 16)
-    return bin(xor).count("1")
+def pack_hashes(hex_hashes: list[str]) -> np.ndarray:
+    """Pack hex hash strings into an (N, words) uint64 array.
+
+    Hashes are left-padded to a whole number of 64-bit words (colorhash
+    has an odd number of hex digits).
+    """
+    width = -(-max(len(h) for h in hex_hashes) // 16) * 16
+    raw = b"".join(bytes.fromhex(h.zfill(width)) for h in hex_hashes)
+    return np.frombuffer(raw, dtype=">u8").astype(np.uint64).reshape(len(hex_hashes), -1)
+
+
+def pairwise_hamming(words: np.ndarray, block: int = 64, panel: int = 512) -> np.ndarray:
+    """Compute all-pairs hamming distances between rows of packed hashes.
+
+    Only the upper triangle (i <= j) is filled; entries below the diagonal
+    are left uninitialised. Each block of rows is compared against one
+    panel of columns at a time, so the XOR intermediate stays cache-sized
+    however large the sample is, and blocks run on a thread pool (NumPy
+    releases the GIL inside ufuncs, so the threads share the inputs and
+    output without copying). Blocks are submitted widest first, so idle
+    threads pick up the short tail of the triangle.
+    """
+    n = len(words)
+    dists = np.empty((n, n), dtype=np.uint16)
+
+    def fill_block(start):
+        rows = words[start:start + block, None, :]
+        # Columns left of the block only feed the lower triangle
+        for col in range(start, n, panel):
+            xor = rows ^ words[None, col:col + panel, :]
+            dists[start:start + block, col:col + panel] = np.bitwise_count(xor).sum(axis=-1, dtype=np.uint16)
+
+    # One thread per core: the kernel is compute-bound and each extra
+    # thread only adds another XOR intermediate
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        list(pool.map(fill_block, range(0, n, block)))
+    return dists
 
 
 _has_pairs_table_cache = None
@@ -109,7 +237,7 @@ def has_pairs_table():
     if _has_pairs_table_cache is not None:
         return _has_pairs_table_cache
 
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.execute("""
         SELECT 1 FROM sqlite_master
         WHERE type='table' AND name='photo_pairs'
@@ -119,69 +247,100 @@ def has_pairs_table():
         # Quick check for data - LIMIT 1 is instant vs COUNT(*) on 82M rows
         row = conn.execute("SELECT 1 FROM photo_pairs LIMIT 1").fetchone()
         exists = row is not None
-    conn.close()
     _has_pairs_table_cache = exists
     return exists
 
 
+# Dense (phash16, colorhash) count arrays: phash16 is 256 bits and colorhash
+# fits in one 64-bit word
+COUNTS_SHAPE = (257, 65)
+# Dense count arrays for the legacy map: [phash_dist, dhash_dist], 64-bit hashes
+LEGACY_COUNTS_SHAPE = (65, 65)
+# The legacy map only shows the range where grouping happens
+LEGACY_MAX_PHASH = 30
+LEGACY_MAX_DHASH = 35
+
 # Cache for dynamically sampled pairs
 _dynamic_cache = None
-# Cache for 2D counts (expensive aggregation query)
-_2d_counts_cache = {}
+# Bumped by /resample so caches keyed on _db_version() drop sampled data
+_sample_generation = 0
+# Sampled pairs kept per (phash16, colorhash) cell; covers the largest page
+DYNAMIC_CELL_LIMIT = 200
+
+# Sampled pairs: dense COUNTS_SHAPE cross-group counts, plus up to
+# DYNAMIC_CELL_LIMIT pair dicts per (phash16, colorhash) cell
+DynamicSample = namedtuple("DynamicSample", ["counts", "pairs_by_cell"])
 
 
 def sample_pairs_dynamically(sample_size: int = 3000):
-    """Sample pairs dynamically from photos with extended hashes."""
+    """Sample pairs dynamically from photos with extended hashes.
+
+    Every cross-group pair is counted, but only the first
+    DYNAMIC_CELL_LIMIT pairs of each cell are kept as dicts, since pages
+    never show more than that.
+    """
     global _dynamic_cache
 
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.execute("""
-        SELECT
-            kp.id, kp.perceptual_hash as phash, kp.dhash,
-            kp.phash_16, kp.colorhash,
-            dg.group_id as primary_group, kp.mime_type
+        SELECT kp.id, kp.phash_16, kp.colorhash, dg.group_id
         FROM kept_photos_with_hashes kp
         LEFT JOIN duplicate_groups dg ON kp.id = dg.photo_id
         ORDER BY RANDOM()
         LIMIT ?
     """, (sample_size,))
-    photos = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-
-    print(f"Sampled {len(photos)} photos with extended hashes")
-
-    # Compute all cross-group pairs
-    from collections import defaultdict
-    pairs_by_phash16 = defaultdict(list)
-
-    for i in range(len(photos)):
-        for j in range(i + 1, len(photos)):
-            p1, p2 = photos[i], photos[j]
-
-            # Skip same-group pairs
-            if p1["primary_group"] is not None and p1["primary_group"] == p2["primary_group"]:
-                continue
-
-            phash16_dist = hamming_distance(p1["phash_16"], p2["phash_16"])
-            colorhash_dist = hamming_distance(p1["colorhash"], p2["colorhash"])
-
-            pairs_by_phash16[phash16_dist].append({
-                "photo_id_1": p1["id"],
-                "photo_id_2": p2["id"],
-                "phash16_dist": phash16_dist,
-                "colorhash_dist": colorhash_dist,
-            })
-
-    # Sort each distance level by colorhash
-    for dist in pairs_by_phash16:
-        pairs_by_phash16[dist].sort(key=lambda x: x["colorhash_dist"])
-
-    _dynamic_cache = pairs_by_phash16
+    rows = cursor.fetchall()
+
+    print(f"Sampled {len(rows)} photos with extended hashes")
+    if not rows:
+        _dynamic_cache = DynamicSample(np.zeros(COUNTS_SHAPE, dtype=np.int32), {})
+        return _dynamic_cache
+
+    # Hex hashes are decoded exactly once, straight into packed arrays
+    ids, phash16s, colorhashes, primary_groups = zip(*rows)
+    phash16_dists = pairwise_hamming(pack_hashes(phash16s))
+    colorhash_dists = pairwise_hamming(pack_hashes(colorhashes))
+
+    # Upper-triangle pairs, minus same-group ones (ungrouped photos get -1)
+    group_codes = {}
+    groups = np.array([
+        -1 if g is None else group_codes.setdefault(g, len(group_codes))
+        for g in primary_groups
+    ])
+    i, j = np.triu_indices(len(ids), k=1)
+    cross = (groups[i] < 0) | (groups[i] != groups[j])
+    i, j = i[cross], j[cross]
+    cell = phash16_dists[i, j].astype(np.int64) * COUNTS_SHAPE[1] + colorhash_dists[i, j]
+
+    # Group by cell, then keep only the head of each cell
+    order = np.argsort(cell, kind="stable")
+    i, j, cell = i[order], j[order], cell[order]
+    cells, starts, sizes = np.unique(cell, return_index=True, return_counts=True)
+    counts = np.zeros(COUNTS_SHAPE, dtype=np.int32)
+    counts.flat[cells] = sizes
+
+    rank = np.arange(len(cell)) - np.repeat(starts, sizes)
+    keep = rank < DYNAMIC_CELL_LIMIT
+    i, j = i[keep], j[keep]
+    heads = np.minimum(sizes, DYNAMIC_CELL_LIMIT).cumsum()[:-1]
+
+    pairs_by_cell = {}
+    for key, bi, bj in zip(cells.tolist(), np.split(i, heads), np.split(j, heads)):
+        p, c = divmod(key, COUNTS_SHAPE[1])
+        pairs_by_cell[p, c] = [
+            {
+                "photo_id_1": ids[a],
+                "photo_id_2": ids[b],
+                "phash16_dist": p,
+                "colorhash_dist": c,
+            }
+            for a, b in zip(bi.tolist(), bj.tolist())
+        ]
 
-    total = sum(len(v) for v in pairs_by_phash16.values())
-    print(f"Computed {total:,} cross-group pairs")
+    _dynamic_cache = DynamicSample(counts, pairs_by_cell)
+    print(f"Computed {int(sizes.sum()):,} cross-group pairs")
 
-    return pairs_by_phash16
+    return _dynamic_cache
 
 
 def get_dynamic_pairs():
@@ -200,7 +359,7 @@ def get_distribution(mode: str):
         dist_col = "colorhash_dist"
 
     if has_pairs_table():
-        conn = get_connection()
+        conn = get_read_connection()
         cursor = conn.execute(f"""
             SELECT {dist_col} as dist, COUNT(*) as cnt
             FROM photo_pairs
@@ -209,20 +368,11 @@ def get_distribution(mode: str):
             ORDER BY {dist_col}
         """)
         result = [(row['dist'], row['cnt']) for row in cursor.fetchall()]
-        conn.close()
         return result
     else:
         # Use dynamic cache
-        pairs = get_dynamic_pairs()
-        from collections import defaultdict
-        counts = defaultdict(int)
-        for phash16_dist, pair_list in pairs.items():
-            for p in pair_list:
-                if mode == "phash16":
-                    counts[phash16_dist] += 1
-                else:
-                    counts[p["colorhash_dist"]] += 1
-        return [(d, counts[d]) for d in sorted(counts.keys())]
+        counts = get_dynamic_pairs().counts.sum(axis=1 if mode == "phash16" else 0)
+        return [(int(d), int(counts[d])) for d in np.flatnonzero(counts)]
 
 
 def get_pairs_at_distance(mode: str, distance: int, limit: int = 200):
@@ -235,44 +385,48 @@ def get_pairs_at_distance(mode: str, distance: int, limit: int = 200):
         order_col = "phash16_dist"
 
     if has_pairs_table():
-        conn = get_connection()
+        conn = get_read_connection()
         cursor = conn.execute(f"""
             SELECT
                 pp.photo_id_1, pp.photo_id_2,
-                pp.phash_dist, pp.dhash_dist, pp.phash16_dist, pp.colorhash_dist,
-                p1.mime_type as mime1, p2.mime_type as mime2
+                pp.phash_dist, pp.dhash_dist, pp.phash16_dist, pp.colorhash_dist
             FROM photo_pairs pp
-            JOIN photos p1 ON pp.photo_id_1 = p1.id
-            JOIN photos p2 ON pp.photo_id_2 = p2.id
             WHERE pp.same_primary_group = 0
             AND pp.{filter_col} = ?
             ORDER BY pp.{order_col} ASC
             LIMIT ?
         """, (distance, limit))
-        pairs = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return pairs
+        # sqlite3.Row supports the templates' pair.x and pair[key] lookups
+        return cursor.fetchall()
     else:
-        # Use dynamic cache
-        all_pairs = get_dynamic_pairs()
-        result = []
-        for phash16_dist, pair_list in all_pairs.items():
-            for p in pair_list:
-                if mode == "phash16" and phash16_dist == distance:
-                    result.append(p)
-                elif mode == "colorhash" and p["colorhash_dist"] == distance:
-                    result.append(p)
-        # Sort by the other hash
+        # Use dynamic cache: walk the line's cells in order of the other hash
+        sample = get_dynamic_pairs()
         if mode == "phash16":
-            result.sort(key=lambda x: x["colorhash_dist"])
+            cells = [(distance, c) for c in range(COUNTS_SHAPE[1])]
         else:
-            result.sort(key=lambda x: x["phash16_dist"])
+            cells = [(p, distance) for p in range(COUNTS_SHAPE[0])]
+        result = []
+        for cell in cells:
+            result += sample.pairs_by_cell.get(cell, [])
+            if len(result) >= limit:
+                break
         return result[:limit]
 
 
+_stats_cache = None  # (db_version, stats)
+
 def get_stats():
-    """Get basic stats."""
-    conn = get_connection()
+    """Get basic stats.
+
+    The COUNT(*) scans are slow on the full pairs table, so results are
+    reused until the database changes.
+    """
+    global _stats_cache
+    version = _db_version()
+    if _stats_cache is not None and _stats_cache[0] == version:
+        return _stats_cache[1]
+
+    conn = get_read_connection()
 
     total_pairs = 0
     cross_group = 0
@@ -291,12 +445,13 @@ def get_stats():
     except:
         pass
 
-    conn.close()
-    return {
+    stats = {
         "total_pairs": total_pairs,
         "cross_group": cross_group,
         "with_extended": with_extended,
     }
+    _stats_cache = (version, stats)
+    return stats
 
 
 TEMPLATE = """
@@ -479,6 +634,9 @@ TEMPLATE = """
 </html>
 """
 
+# Compiled once; render_template_string re-parses the source on every call
+_PAIRS_TEMPLATE = app.jinja_env.from_string(TEMPLATE)
+
 
 @app.route('/')
 def index():
@@ -491,8 +649,9 @@ def index():
 @app.route('/resample/<mode>')
 def resample(mode):
     """Clear dynamic cache and resample."""
-    global _dynamic_cache
+    global _dynamic_cache, _sample_generation
     _dynamic_cache = None
+    _sample_generation += 1
     if mode == "colorhash":
         return app.redirect('/colorhash/0')
     return app.redirect('/phash16/20')
@@ -521,8 +680,7 @@ def show_distance(mode, distance):
         order_label = "pHash16"
         order_key = "phash16_dist"
 
-    return render_template_string(
-        TEMPLATE,
+    return _PAIRS_TEMPLATE.render(
         mode=mode,
         distance=distance,
         pairs=pairs,
@@ -538,39 +696,41 @@ def show_distance(mode, distance):
 
 def get_pairs_at_2d_point(phash16: int, colorhash: int, limit: int = 24):
     """Get pairs at exact (phash16, colorhash) coordinate."""
-    p_range = 0  # exact match
-    c_range = 0  # exact match
-
     if has_pairs_table():
-        conn = get_connection()
+        conn = get_read_connection()
         cursor = conn.execute("""
             SELECT
                 pp.photo_id_1, pp.photo_id_2,
                 pp.phash16_dist, pp.colorhash_dist
             FROM photo_pairs pp
             WHERE pp.same_primary_group = 0
-            AND pp.phash16_dist BETWEEN ? AND ?
-            AND pp.colorhash_dist BETWEEN ? AND ?
-            ORDER BY ABS(pp.phash16_dist - ?) + ABS(pp.colorhash_dist - ?)
+            AND pp.phash16_dist = ?
+            AND pp.colorhash_dist = ?
             LIMIT ?
-        """, (phash16 - p_range, phash16 + p_range,
-              colorhash - c_range, colorhash + c_range,
-              phash16, colorhash, limit))
-        pairs = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return pairs
+        """, (phash16, colorhash, limit))
+        # sqlite3.Row supports the templates' pair.x and pair[key] lookups
+        return cursor.fetchall()
     else:
         # Use dynamic cache
-        all_pairs = get_dynamic_pairs()
-        result = []
-        for phash16_dist, pair_list in all_pairs.items():
-            if abs(phash16_dist - phash16) <= p_range:
-                for p in pair_list:
-                    if abs(p["colorhash_dist"] - colorhash) <= c_range:
-                        result.append(p)
-        # Sort by distance from target point
-        result.sort(key=lambda p: abs(p["phash16_dist"] - phash16) + abs(p["colorhash_dist"] - colorhash))
-        return result[:limit]
+        return get_dynamic_pairs().pairs_by_cell.get((phash16, colorhash), [])[:limit]
+
+
+def get_preload_ids_at_2d_point(phash16: int, colorhash: int, limit: int = 24) -> list[str]:
+    """Photo IDs of the pairs at a coordinate, for image preloading only."""
+    if has_pairs_table():
+        conn = get_read_connection()
+        cursor = conn.execute("""
+            SELECT photo_id_1, photo_id_2
+            FROM photo_pairs
+            WHERE same_primary_group = 0
+            AND phash16_dist = ?
+            AND colorhash_dist = ?
+            LIMIT ?
+        """, (phash16, colorhash, limit))
+        return [photo_id for row in cursor.fetchall() for photo_id in row]
+
+    pair_list = get_dynamic_pairs().pairs_by_cell.get((phash16, colorhash), [])
+    return [photo_id for p in pair_list[:limit] for photo_id in (p["photo_id_1"], p["photo_id_2"])]
 
 
 _has_summary_table_cache = None
@@ -581,104 +741,74 @@ def has_summary_table():
     if _has_summary_table_cache is not None:
         return _has_summary_table_cache
 
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.execute("""
         SELECT 1 FROM sqlite_master
         WHERE type='table' AND name='pair_count_summary'
     """)
     _has_summary_table_cache = cursor.fetchone() is not None
-    conn.close()
     return _has_summary_table_cache
 
 
 def get_2d_counts(include_same_group=False):
-    """Get counts at each (phash16, colorhash) point for heatmap."""
-    global _2d_counts_cache
-    cache_key = "with_same" if include_same_group else "cross_only"
-    if cache_key in _2d_counts_cache:
-        return _2d_counts_cache[cache_key]
+    """Get counts at each (phash16, colorhash) point for heatmap.
+
+    Returns a dense COUNTS_SHAPE int32 array indexed [phash16, colorhash],
+    or a (cross_counts, same_counts) pair of arrays if include_same_group.
+    """
+    cross_counts, same_counts = load_2d_counts(_db_version())
+    return (cross_counts, same_counts) if include_same_group else cross_counts
 
-    # Use summary table if available (much faster)
+
+@functools.lru_cache(maxsize=2)
+def load_2d_counts(db_version: tuple[int, int]):
+    """Aggregate (cross_counts, same_counts) arrays with one grouped query.
+
+    Cached per database version, so a repopulated pairs table is picked up.
+    """
+    # Use summary table if available (much faster), else fall back to photo_pairs
     if has_summary_table():
-        conn = get_connection()
-        if include_same_group:
-            cursor = conn.execute("""
-                SELECT phash16_dist, colorhash_dist, same_primary_group, SUM(count) as cnt
-                FROM pair_count_summary
-                GROUP BY phash16_dist, colorhash_dist, same_primary_group
-            """)
-            cross_counts = {}
-            same_counts = {}
-            for row in cursor.fetchall():
-                key = (row['phash16_dist'], row['colorhash_dist'])
-                if row['same_primary_group']:
-                    same_counts[key] = row['cnt']
-                else:
-                    cross_counts[key] = row['cnt']
-            conn.close()
-            result = (cross_counts, same_counts)
-            _2d_counts_cache[cache_key] = result
-            return result
-        else:
-            cursor = conn.execute("""
-                SELECT phash16_dist, colorhash_dist, SUM(count) as cnt
-                FROM pair_count_summary
-                WHERE same_primary_group = 0
-                GROUP BY phash16_dist, colorhash_dist
-            """)
-            counts = {(row['phash16_dist'], row['colorhash_dist']): row['cnt']
-                      for row in cursor.fetchall()}
-            conn.close()
-            _2d_counts_cache[cache_key] = counts
-            return counts
-
-    # Fall back to photo_pairs table (slower)
-    if has_pairs_table():
-        conn = get_connection()
-        if include_same_group:
-            # Get both cross-group and same-group counts
-            cursor = conn.execute("""
-                SELECT phash16_dist, colorhash_dist, same_primary_group, COUNT(*) as cnt
-                FROM photo_pairs
-                GROUP BY phash16_dist, colorhash_dist, same_primary_group
-            """)
-            cross_counts = {}
-            same_counts = {}
-            for row in cursor.fetchall():
-                key = (row['phash16_dist'], row['colorhash_dist'])
-                if row['same_primary_group']:
-                    same_counts[key] = row['cnt']
-                else:
-                    cross_counts[key] = row['cnt']
-            conn.close()
-            result = (cross_counts, same_counts)
-            _2d_counts_cache[cache_key] = result
-            return result
-        else:
-            cursor = conn.execute("""
-                SELECT phash16_dist, colorhash_dist, COUNT(*) as cnt
-                FROM photo_pairs
-                WHERE same_primary_group = 0
-                GROUP BY phash16_dist, colorhash_dist
-            """)
-            counts = {(row['phash16_dist'], row['colorhash_dist']): row['cnt']
-                      for row in cursor.fetchall()}
-            conn.close()
-            _2d_counts_cache[cache_key] = counts
-            return counts
+        query = """
+            SELECT phash16_dist, colorhash_dist, same_primary_group, SUM(count) as cnt
+            FROM pair_count_summary
+            GROUP BY phash16_dist, colorhash_dist, same_primary_group
+        """
+    elif has_pairs_table():
+        query = """
+            SELECT phash16_dist, colorhash_dist, same_primary_group, COUNT(*) as cnt
+            FROM photo_pairs
+            GROUP BY phash16_dist, colorhash_dist, same_primary_group
+        """
     else:
-        all_pairs = get_dynamic_pairs()
-        from collections import defaultdict
-        counts = defaultdict(int)
-        for phash16_dist, pair_list in all_pairs.items():
-            for p in pair_list:
-                counts[(phash16_dist, p["colorhash_dist"])] += 1
-        if include_same_group:
-            result = (dict(counts), {})  # No same-group data in dynamic cache
-            _2d_counts_cache[cache_key] = result
-            return result
-        _2d_counts_cache[cache_key] = dict(counts)
-        return dict(counts)
+        # No same-group data in dynamic cache
+        return get_dynamic_pairs().counts, np.zeros(COUNTS_SHAPE, dtype=np.int32)
+
+    conn = get_read_connection()
+    rows = np.array(conn.execute(query).fetchall(), dtype=np.int64).reshape(-1, 4)
+
+    cross_counts = np.zeros(COUNTS_SHAPE, dtype=np.int32)
+    same_counts = np.zeros(COUNTS_SHAPE, dtype=np.int32)
+    same = rows[:, 2] != 0
+    cross_counts[rows[~same, 0], rows[~same, 1]] = rows[~same, 3]
+    same_counts[rows[same, 0], rows[same, 1]] = rows[same, 3]
+    return cross_counts, same_counts
+
+
+# Navigable 2D grid: phash16 distances 0-150, colorhash distances 0-14
+GRID_ROWS = 151
+GRID_COLS = 15
+
+
+@functools.lru_cache(maxsize=2)
+def cells_bitmap(db_version: tuple[int, int]) -> str:
+    """Pack the (phash16, colorhash) cells that have data into a hex bitmap.
+
+    Bit (p * GRID_COLS + c) is set if cell (p, c) has any pairs. Built
+    once per database version; every /2d page embeds the same string.
+    """
+    counts, _ = load_2d_counts(db_version)
+    has_data = counts[:GRID_ROWS, :GRID_COLS] > 0
+    return np.packbits(has_data.ravel(), bitorder="little").tobytes().hex()
 
 
 TEMPLATE_2D = """
@@ -800,8 +930,15 @@ TEMPLATE_2D = """
     </div>
 
     <script>
-        const cellsWithData = {{ cells_with_data | tojson }};
-        const ratings = {{ ratings_json | tojson }};
+        // Bitmap of cells with data: bit (p * gridCols + c), hex-encoded
+        const gridRows = {{ grid_rows }};
+        const gridCols = {{ grid_cols }};
+        const cellsBits = Uint8Array.from('{{ cells_bits }}'.match(/../g) || [], h => parseInt(h, 16));
+
+        function hasData(p, c) {
+            const i = p * gridCols + c;
+            return (cellsBits[i >> 3] >> (i & 7)) & 1;
+        }
 
         function rate(r) {
             fetch('/rate/{{ phash16 }}/{{ colorhash }}/' + r, {method: 'POST'})
@@ -813,10 +950,10 @@ TEMPLATE_2D = """
 
         function findNextCell(p, c) {
             // Find next cell with data, scanning row by row
-            for (let checkP = p; checkP <= 150; checkP++) {
+            for (let checkP = p; checkP < gridRows; checkP++) {
                 let startC = (checkP === p) ? c + 1 : 0;
-                for (let checkC = startC; checkC <= 14; checkC++) {
-                    if (cellsWithData[checkP + ',' + checkC]) {
+                for (let checkC = startC; checkC < gridCols; checkC++) {
+                    if (hasData(checkP, checkC)) {
                         return [checkP, checkC];
                     }
                 }
@@ -870,6 +1007,8 @@ TEMPLATE_2D = """
 </html>
 """
 
+_2D_TEMPLATE = app.jinja_env.from_string(TEMPLATE_2D)
+
 
 @app.route('/2d/<int:phash16>/<int:colorhash>')
 def show_2d(phash16, colorhash):
@@ -879,33 +1018,28 @@ def show_2d(phash16, colorhash):
     pairs = get_pairs_at_2d_point(phash16, colorhash, limit=24)
     t1 = time.time()
     current_rating = get_rating(phash16, colorhash)
-    ratings = load_ratings()
     t2 = time.time()
 
-    # Get cells with data for navigation
-    counts = get_2d_counts()
+    # Get cells with data for navigation, both from the same database version
+    db_version = _db_version()
+    counts, _ = load_2d_counts(db_version)
     t3 = time.time()
-    cells_with_data = {f"{k[0]},{k[1]}": True for k in counts.keys()}
+    cells_bits = cells_bitmap(db_version)
 
     # Find next cell and preload its images
-    next_cell = find_next_unrated_cell(counts, ratings, phash16, colorhash)
-    preload_ids = []
-    if next_cell:
-        next_pairs = get_pairs_at_2d_point(next_cell[0], next_cell[1], limit=24)
-        for p in next_pairs:
-            preload_ids.append(p['photo_id_1'])
-            preload_ids.append(p['photo_id_2'])
+    next_cell = find_next_unrated_cell(counts, phash16, colorhash)
+    preload_ids = get_preload_ids_at_2d_point(*next_cell, limit=24) if next_cell else []
     t4 = time.time()
     print(f"TIMING: pairs={t1-t0:.3f}s, ratings={t2-t1:.3f}s, counts={t3-t2:.3f}s, preload={t4-t3:.3f}s")
 
-    return render_template_string(
-        TEMPLATE_2D,
+    return _2D_TEMPLATE.render(
         phash16=phash16,
         colorhash=colorhash,
         pairs=pairs,
         current_rating=current_rating,
-        cells_with_data=cells_with_data,
-        ratings_json=ratings,
+        cells_bits=cells_bits,
+        grid_rows=GRID_ROWS,
+        grid_cols=GRID_COLS,
         preload_ids=preload_ids,
     )
 
@@ -944,46 +1078,74 @@ def clear_threshold(kind):
     return "OK"
 
 
-def find_next_unrated_cell(counts, ratings, start_p, start_c):
-    """Find next cell with data that hasn't been rated."""
-    for p in range(start_p, 151):
-        start = start_c + 1 if p == start_p else 0
-        for c in range(start, 15):
-            if (p, c) in counts and f"{p},{c}" not in ratings:
-                return (p, c)
-    return None
+def find_next_unrated_cell(counts, start_p, start_c):
+    """Find next cell with data that hasn't been rated, scanning row by row."""
+    unrated = get_ratings_array()[:GRID_ROWS, :GRID_COLS] == 0
+    searchable = (counts[:GRID_ROWS, :GRID_COLS] > 0) & unrated
+    flat = searchable.ravel()
+    start = start_p * GRID_COLS + min(start_c, GRID_COLS - 1) + 1
+    if start >= flat.size:
+        return None
+    idx = start + int(np.argmax(flat[start:]))
+    if not flat[idx]:
+        return None
+    return divmod(idx, GRID_COLS)
 
 
-def should_skip_row(ratings, p, max_c=14):
+def should_skip_row(p, max_c=14):
     """Check if we should skip to next row (2+ consecutive '5' ratings)."""
-    consecutive_bad = 0
-    for c in range(max_c + 1):
-        r = ratings.get(f"{p},{c}")
-        if r == 5:
-            consecutive_bad += 1
-            if consecutive_bad >= 2:
-                return True
+    bad = get_ratings_array()[p, :max_c + 1] == 5
+    return bool((bad[:-1] & bad[1:]).any())
+
+
+# (ratings array version, rows auto-scan should skip) - rebuilt whenever the
+# ratings array is, and kept in step with it by set_rating
+_skip_rows = None
+
+
+def get_skip_rows() -> set[int]:
+    """Get the phash16 rows with 2+ consecutive '5' ratings."""
+    global _skip_rows
+    ratings = get_ratings_array()
+    version = _ratings_array_cache[0]
+    if _skip_rows is None or _skip_rows[0] != version:
+        bad = ratings[:, :GRID_COLS] == 5
+        _skip_rows = (version, set(np.flatnonzero((bad[:, :-1] & bad[:, 1:]).any(axis=1)).tolist()))
+    return _skip_rows[1]
+
+
+def update_skip_row(p, array_version):
+    """Recompute the skip state of one row after its ratings changed.
+
+    Only a set built from the ratings array as it was before the change
+    (array_version) is patched; any other set is stale and left to rebuild.
+    """
+    global _skip_rows
+    if _skip_rows is None or _skip_rows[0] != array_version:
+        return
+    rows = _skip_rows[1]
+    if p < COUNTS_SHAPE[0]:
+        if should_skip_row(p):
+            rows.add(p)
         else:
-            consecutive_bad = 0
-    return False
+            rows.discard(p)
+    _skip_rows = (_ratings_array_cache[0], rows)
 
 
 @app.route('/auto/<int:phash16>/<int:colorhash>')
 def auto_scan(phash16, colorhash):
     """Auto-navigate to next interesting cell."""
     counts = get_2d_counts()
-    ratings = load_ratings()
 
     # If current row has 2+ consecutive bad ratings, skip to next row
-    if should_skip_row(ratings, phash16):
+    if phash16 in get_skip_rows():
         # Find first cell with data in next row
-        for p in range(phash16 + 1, 151):
-            for c in range(15):
-                if (p, c) in counts and f"{p},{c}" not in ratings:
-                    return app.redirect(f'/2d/{p}/{c}')
+        next_cell = find_next_unrated_cell(counts, phash16, GRID_COLS - 1)
+        if next_cell:
+            return app.redirect(f'/2d/{next_cell[0]}/{next_cell[1]}')
 
     # Otherwise find next unrated cell
-    next_cell = find_next_unrated_cell(counts, ratings, phash16, colorhash)
+    next_cell = find_next_unrated_cell(counts, phash16, colorhash)
     if next_cell:
         return app.redirect(f'/2d/{next_cell[0]}/{next_cell[1]}')
 
@@ -1022,12 +1184,12 @@ TEMPLATE_RATINGS = """
     {% if ratings %}
     <table>
         <tr><th>pHash16</th><th>cHash</th><th>Rating</th><th></th></tr>
-        {% for coord, rating in ratings_sorted %}
+        {% for p, c, rating in ratings_sorted %}
         <tr>
-            <td>{{ coord.split(',')[0] }}</td>
-            <td>{{ coord.split(',')[1] }}</td>
+            <td>{{ p }}</td>
+            <td>{{ c }}</td>
             <td class="r{{ rating }}">{{ rating }}</td>
-            <td><a href="/2d/{{ coord.split(',')[0] }}/{{ coord.split(',')[1] }}">view</a></td>
+            <td><a href="/2d/{{ p }}/{{ c }}">view</a></td>
         </tr>
         {% endfor %}
     </table>
@@ -1038,23 +1200,67 @@ TEMPLATE_RATINGS = """
 </html>
 """
 
+_RATINGS_TEMPLATE = app.jinja_env.from_string(TEMPLATE_RATINGS)
+
 
 @app.route('/ratings')
 def show_ratings():
     """Show all recorded ratings."""
     ratings = load_ratings()
-    # Sort by phash16 then colorhash
+    # Parse each "p,c" key once; tuples sort by phash16 then colorhash
     ratings_sorted = sorted(
-        ratings.items(),
-        key=lambda x: (int(x[0].split(',')[0]), int(x[0].split(',')[1]))
+        (*map(int, key.split(',')), rating) for key, rating in ratings.items()
     )
-    return render_template_string(
-        TEMPLATE_RATINGS,
+    return _RATINGS_TEMPLATE.render(
         ratings=ratings,
         ratings_sorted=ratings_sorted,
     )
 
 
+TEMPLATE_DIST_GRID = """
+{% macro heat_rows(rows) %}
+        {% for p, cells in rows %}
+        <tr>
+            <td class="header">{{ p }}</td>
+            {% for cell in cells %}
+            <td class="{{ cell.cls }}" data-p="{{ p }}" data-c="{{ cell.c }}"{% if cell.onclick %} onclick="{{ cell.onclick }}"{% endif %}>{{ cell.text }}</td>
+            {% endfor %}
+        </tr>
+        {% endfor %}
+{% endmacro %}
+    <div class="tables">
+    <div class="table-section">
+    <h3>Cross-group pairs (green = more pairs)</h3>
+    <table class="cross-grid">
+        <tr>
+            <td class="header">p\\c</td>
+            {% for c in range(max_colorhash + 1) %}
+            <td class="header">{{ c }}</td>
+            {% endfor %}
+        </tr>
+        {{ heat_rows(cross_rows) }}
+    </table>
+    </div>
+
+    {% if has_same %}
+    <div class="table-section">
+    <h3>Same-group pairs (blue = more pairs)</h3>
+    <p style="color:#888;font-size:0.9em">These are known duplicates - should cluster in "good" zone</p>
+    <table class="same-grid">
+        <tr>
+            <td class="header">p\\c</td>
+            {% for c in range(max_colorhash + 1) %}
+            <td class="header">{{ c }}</td>
+            {% endfor %}
+        </tr>
+        {{ heat_rows(same_rows) }}
+    </table>
+    </div>
+    {% endif %}
+    </div>
+"""
+
+
 TEMPLATE_DIST = """
 <!DOCTYPE html>
 <html>
@@ -1125,74 +1331,7 @@ TEMPLATE_DIST = """
         .mode-btn.active { background: #555; border-color: #aaa; }
     </style>
 
-    <div class="tables">
-    <div class="table-section">
-    <h3>Cross-group pairs (green = more pairs)</h3>
-    <table>
-        <tr>
-            <td class="header">p\\c</td>
-            {% for c in range(max_colorhash + 1) %}
-            <td class="header">{{ c }}</td>
-            {% endfor %}
-        </tr>
-        {% for p in range(min_phash16, max_phash16 + 1, 2) %}
-        <tr>
-            <td class="header">{{ p }}</td>
-            {% for c in range(max_colorhash + 1) %}
-            {% set count = cross_counts.get((p, c), 0) + cross_counts.get((p+1, c), 0) %}
-            {% set r = ratings.get(p|string + ',' + c|string) %}
-            {% set th_class = '' %}
-            {% set key = p|string + ',' + c|string %}
-            {% if key in complete_right %}{% set th_class = th_class + ' th-complete-right' %}{% endif %}
-            {% if key in complete_bottom %}{% set th_class = th_class + ' th-complete-bottom' %}{% endif %}
-            {% if key in single_right %}{% set th_class = th_class + ' th-single-right' %}{% endif %}
-            {% if key in single_bottom %}{% set th_class = th_class + ' th-single-bottom' %}{% endif %}
-            {% if key in thresholds.complete %}{% set th_class = th_class + ' th-complete-marked' %}{% endif %}
-            {% if key in thresholds.single %}{% set th_class = th_class + ' th-single-marked' %}{% endif %}
-            {% if count > 0 %}
-            <td class="has-data {% if r %}cell-r{{ r }}{% else %}cell-unrated{% endif %}{{ th_class }}" data-p="{{ p }}" data-c="{{ c }}" onclick="cellClick({{ p }}, {{ c }})">
-                {{ count if count < 1000 else '1k+' }}
-            </td>
-            {% else %}
-            <td class="cell-empty{{ th_class }}" data-p="{{ p }}" data-c="{{ c }}" onclick="cellClick({{ p }}, {{ c }})">·</td>
-            {% endif %}
-            {% endfor %}
-        </tr>
-        {% endfor %}
-    </table>
-    </div>
-
-    {% if same_counts %}
-    <div class="table-section">
-    <h3>Same-group pairs (blue = more pairs)</h3>
-    <p style="color:#888;font-size:0.9em">These are known duplicates - should cluster in "good" zone</p>
-    <table>
-        <tr>
-            <td class="header">p\\c</td>
-            {% for c in range(max_colorhash + 1) %}
-            <td class="header">{{ c }}</td>
-            {% endfor %}
-        </tr>
-        {% for p in range(min_phash16, max_phash16 + 1, 2) %}
-        <tr>
-            <td class="header">{{ p }}</td>
-            {% for c in range(max_colorhash + 1) %}
-            {% set count = same_counts.get((p, c), 0) + same_counts.get((p+1, c), 0) %}
-            {% set r = ratings.get(p|string + ',' + c|string) %}
-            {% if count > 0 %}
-            <td class="same-group same-heat-{{ [5, (count // 10) + 1] | min }} {% if r %}rated rated-{{ r }}{% endif %}">
-                {{ count if count < 1000 else '1k+' }}
-            </td>
-            {% else %}
-            <td class="heat-0 {% if r %}rated rated-{{ r }}{% endif %}">·</td>
-            {% endif %}
-            {% endfor %}
-        </tr>
-        {% endfor %}
-    </table>
-    </div>
-    {% endif %}
-    </div>
+    {{ grid_html }}
 
     <div class="legend">
         <span class="rated-1" style="color:#2a5">■ 1=good</span>
@@ -1205,8 +1344,42 @@ TEMPLATE_DIST = """
     <script>
         let drawMode = localStorage.getItem('drawMode') || 'nav';
 
-        // Restore mode on page load
-        document.addEventListener('DOMContentLoaded', () => setMode(drawMode));
+        // Restore mode and decorate the cached page on load
+        document.addEventListener('DOMContentLoaded', () => {
+            setMode(drawMode);
+            refreshCellState();
+        });
+
+        function refreshCellState() {
+            fetch('/dist.json')
+                .then(r => r.json())
+                .then(state => applyCellState(state.ratings, state.threshold_classes));
+        }
+
+        // Classes applyCellState owns, as opposed to the cached heat classes
+        const CELL_STATE_CLASS = /^(cell-r\d|cell-unrated|th-|rated)/;
+
+        function clearCellState(td) {
+            td.classList.remove(...[...td.classList].filter(cls => CELL_STATE_CLASS.test(cls)));
+        }
+
+        function applyCellState(ratings, thresholdClasses) {
+            // The page HTML is cached server-side; ratings and thresholds are applied here
+            document.querySelectorAll('.cross-grid td[data-p]').forEach(td => {
+                clearCellState(td);
+                const key = td.dataset.p + ',' + td.dataset.c;
+                const r = ratings[key];
+                if (td.classList.contains('has-data')) {
+                    td.classList.add(r ? 'cell-r' + r : 'cell-unrated');
+                }
+                (thresholdClasses[key] || []).forEach(cls => td.classList.add(cls));
+            });
+            document.querySelectorAll('.same-grid td[data-p]').forEach(td => {
+                clearCellState(td);
+                const r = ratings[td.dataset.p + ',' + td.dataset.c];
+                if (r) td.classList.add('rated', 'rated-' + r);
+            });
+        }
 
         function setMode(mode) {
             drawMode = mode;
@@ -1219,15 +1392,16 @@ TEMPLATE_DIST = """
             if (drawMode === 'nav') {
                 window.location = '/2d/' + p + '/' + c;
             } else {
+                // Only the classes change, so re-apply them rather than reload the grid
                 fetch('/threshold/' + drawMode + '/' + p + '/' + c, {method: 'POST'})
-                    .then(() => window.location.reload());
+                    .then(refreshCellState);
             }
         }
 
         function clearThreshold(kind) {
             if (confirm('Clear all ' + kind + ' boundary cells?')) {
                 fetch('/threshold/clear/' + kind, {method: 'POST'})
-                    .then(() => window.location.reload());
+                    .then(refreshCellState);
             }
         }
     </script>
@@ -1235,133 +1409,252 @@ TEMPLATE_DIST = """
 </html>
 """
 
+_DIST_GRID_TEMPLATE = app.jinja_env.from_string(TEMPLATE_DIST_GRID)
+_DIST_TEMPLATE = app.jinja_env.from_string(TEMPLATE_DIST)
+
+
+def _db_version() -> tuple[int, int]:
+    """Cheap freshness token for caches derived from the database.
+
+    PRAGMA data_version on the shared read connection changes whenever
+    another connection commits, including commits that are still only in
+    the WAL and haven't touched the main file's mtime. It is combined with
+    the sample generation, since in sampled mode /resample changes the data
+    without touching the database.
+    """
+    data_version = get_read_connection().execute("PRAGMA data_version").fetchone()[0]
+    return data_version, _sample_generation
+
+
+# One pre-formatted heatmap cell; onclick is None for non-navigable tables
+Cell = namedtuple("Cell", ["c", "text", "cls", "onclick"])
+
+# CSS class per same-group heat bucket (0 = no pairs)
+SAME_HEAT_CLASSES = np.array(
+    ["heat-0"] + [f"same-group same-heat-{h}" for h in range(1, 6)], dtype=object
+)
+
+
+def format_count(count):
+    """Short label for a heatmap cell."""
+    return str(count) if count < 1000 else "1k+"
+
+
+@functools.lru_cache(maxsize=2)
+def render_dist_page(db_version: tuple[int, int]):
+    """Render the /dist page once per database version.
+
+    Counts don't change between rating operations, so the page is cached
+    without any rating or threshold classes; the browser fetches those
+    from /dist.json and applies them. Returns None if there is no data yet.
+    """
+    # The counts for this version, not whatever is current by now
+    cross_counts, same_counts = load_2d_counts(db_version)
+
+    # Occupied rows/columns come back sorted, so the bounds are the ends
+    has_data = cross_counts | same_counts
+    phash16s = np.flatnonzero(has_data.any(axis=1))
+    if not len(phash16s):
+        return None
+    colorhashes = np.flatnonzero(has_data.any(axis=0))
+
+    min_phash16 = int(phash16s[0])
+    max_phash16 = min(int(phash16s[-1]), 140)  # Cap display
+    max_colorhash = min(int(colorhashes[-1]), 14)  # Cap display
+
+    # Merge pHash rows in pairs (p, p+1) once up front
+    row_labels = range(min_phash16, max_phash16 + 1, 2)
+    end = min_phash16 + 2 * len(row_labels)
+    cols = slice(0, max_colorhash + 1)
+    merged_cross = cross_counts[min_phash16:end:2, cols] + cross_counts[min_phash16 + 1:end:2, cols]
+    merged_same = same_counts[min_phash16:end:2, cols] + same_counts[min_phash16 + 1:end:2, cols]
+
+    # Heat bucket for every same-group cell at once; 0 stays empty
+    same_heat = np.where(merged_same > 0, np.minimum(5, merged_same // 10 + 1), 0)
+    same_classes = SAME_HEAT_CLASSES[same_heat].tolist()
+
+    # Build every cell here; Jinja just emits them
+    cross_rows = []
+    same_rows = []
+    for p, cross_row, same_row, same_cls_row in zip(
+        row_labels, merged_cross.tolist(), merged_same.tolist(), same_classes
+    ):
+        cross_cells = []
+        same_cells = []
+        for c, (count, same_count, same_cls) in enumerate(zip(cross_row, same_row, same_cls_row)):
+            onclick = f"cellClick({p}, {c})"
+            if count:
+                cross_cells.append(Cell(c, format_count(count), "has-data", onclick))
+            else:
+                cross_cells.append(Cell(c, "·", "cell-empty", onclick))
 
-@app.route('/dist')
-def show_distribution():
-    """Show 2D distribution heatmap."""
-    result = get_2d_counts(include_same_group=True)
+            same_cells.append(Cell(c, format_count(same_count) if same_count else "·", same_cls, None))
+        cross_rows.append((p, cross_cells))
+        same_rows.append((p, same_cells))
 
-    if isinstance(result, tuple):
-        cross_counts, same_counts = result
-    else:
-        cross_counts, same_counts = result, {}
+    grid_html = _DIST_GRID_TEMPLATE.render(
+        cross_rows=cross_rows,
+        same_rows=same_rows,
+        has_same=same_counts.any(),
+        max_colorhash=max_colorhash,
+    )
+    return _DIST_TEMPLATE.render(grid_html=Markup(grid_html), min_phash16=min_phash16)
 
-    if not cross_counts and not same_counts:
-        return "No data yet. Waiting for sampling.", 200
 
-    all_keys = set(cross_counts.keys()) | set(same_counts.keys())
-    min_phash16 = min(k[0] for k in all_keys)
-    max_phash16 = min(max(k[0] for k in all_keys), 140)  # Cap display
-    max_colorhash = min(max(k[1] for k in all_keys), 14)  # Cap display
-    ratings = load_ratings()
-    thresholds = load_thresholds()
+@functools.lru_cache(maxsize=2)
+def gzip_dist_page(db_version: tuple[int, int]) -> bytes:
+    """The cached /dist page, gzip-compressed once per database version."""
+    return gzip.compress(render_dist_page(db_version).encode(), compresslevel=6)
 
-    # Compute actual line edges from marked boundary cells
-    def compute_edges(marked_cells):
-        """Compute right/bottom edges from marked boundary cells.
 
-        Marked cells are the last INCLUDED cells. The line goes:
-        - Along the bottom of cells at each colorhash level
-        - Down the right side when stepping to a lower phash16
-        """
-        if not marked_cells:
-            return [], []
+def compute_edges(marked_cells):
+    """Compute right/bottom edges from marked boundary cells.
 
-        # Parse cells and find max phash16 for each colorhash
-        max_p_by_c = {}
-        for key in marked_cells:
-            p, c = map(int, key.split(','))
-            if c not in max_p_by_c or p > max_p_by_c[c]:
-                max_p_by_c[c] = p
-
-        right_edges = []  # cells needing right border
-        bottom_edges = []  # cells needing bottom border
-
-        sorted_c = sorted(max_p_by_c.keys())
-        for i, c in enumerate(sorted_c):
-            p = max_p_by_c[c]
-            # Bottom edge on the boundary cell
-            bottom_edges.append(f"{p},{c}")
-            # Right edge if next colorhash has lower max_p or doesn't exist
-            if i == len(sorted_c) - 1 or c + 1 not in max_p_by_c:
-                # Last colorhash - right edge on this cell
-                right_edges.append(f"{p},{c}")
-            elif max_p_by_c.get(c + 1, 0) < p:
-                # Next colorhash has lower threshold - draw right edges down
-                next_p = max_p_by_c[c + 1]
-                for pp in range(next_p + 2, p + 1, 2):
-                    right_edges.append(f"{pp},{c}")
-
-        return right_edges, bottom_edges
+    Marked cells are the last INCLUDED cells. The line goes:
+    - Along the bottom of cells at each colorhash level
+    - Down the right side when stepping to a lower phash16
+    """
+    if not marked_cells:
+        return [], []
+
+    # Parse cells and find max phash16 for each colorhash
+    max_p_by_c = {}
+    for key in marked_cells:
+        p, c = map(int, key.split(','))
+        if c not in max_p_by_c or p > max_p_by_c[c]:
+            max_p_by_c[c] = p
+
+    right_edges = []  # cells needing right border
+    bottom_edges = []  # cells needing bottom border
 
+    sorted_c = sorted(max_p_by_c.keys())
+    for i, c in enumerate(sorted_c):
+        p = max_p_by_c[c]
+        # Bottom edge on the boundary cell
+        bottom_edges.append(f"{p},{c}")
+        # Right edge if next colorhash has lower max_p or doesn't exist
+        if i == len(sorted_c) - 1 or c + 1 not in max_p_by_c:
+            # Last colorhash - right edge on this cell
+            right_edges.append(f"{p},{c}")
+        elif max_p_by_c.get(c + 1, 0) < p:
+            # Next colorhash has lower threshold - draw right edges down
+            next_p = max_p_by_c[c + 1]
+            for pp in range(next_p + 2, p + 1, 2):
+                right_edges.append(f"{pp},{c}")
+
+    return right_edges, bottom_edges
+
+
+@functools.lru_cache(maxsize=2)
+def threshold_classes(thresholds_version: int | None) -> dict:
+    """get_threshold_classes for the saved thresholds, once per file version."""
+    return get_threshold_classes(load_thresholds())
+
+
+def get_threshold_classes(thresholds: dict) -> dict:
+    """Map each cell key to the threshold CSS classes it needs."""
     complete_right, complete_bottom = compute_edges(thresholds.get("complete", []))
     single_right, single_bottom = compute_edges(thresholds.get("single", []))
 
-    return render_template_string(
-        TEMPLATE_DIST,
-        cross_counts=cross_counts,
-        same_counts=same_counts,
-        min_phash16=min_phash16,
-        max_phash16=max_phash16,
-        max_colorhash=max_colorhash,
-        ratings=ratings,
-        thresholds=thresholds,
-        complete_right=complete_right,
-        complete_bottom=complete_bottom,
-        single_right=single_right,
-        single_bottom=single_bottom,
-    )
+    classes = defaultdict(list)
+    for cls, keys in (
+        ("th-complete-right", complete_right),
+        ("th-complete-bottom", complete_bottom),
+        ("th-single-right", single_right),
+        ("th-single-bottom", single_bottom),
+        ("th-complete-marked", thresholds.get("complete", [])),
+        ("th-single-marked", thresholds.get("single", [])),
+    ):
+        for key in keys:
+            classes[key].append(cls)
+    return classes
+
+
+# Distinguishes this server run's /dist ETags from an earlier run's
+DIST_ETAG_RUN = os.urandom(4).hex()
+
+
+@app.route('/dist')
+def show_distribution():
+    """Show 2D distribution heatmap."""
+    db_version = _db_version()
+    page = render_dist_page(db_version)
+    if page is None:
+        return "No data yet. Waiting for sampling.", 200
 
+    if 'gzip' in request.accept_encodings:
+        response = app.response_class(gzip_dist_page(db_version), mimetype='text/html')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = app.response_class(page, mimetype='text/html')
+    response.vary.add('Accept-Encoding')
+    # The page only changes with the database, so revalidate by its version
+    # and answer 304 without sending the body again. data_version counts
+    # from scratch on each new connection, so the ETag also names this run.
+    response.set_etag("dist-{}-{}-{}".format(DIST_ETAG_RUN, *db_version), weak=True)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route('/dist.json')
+def dist_state():
+    """Ratings and threshold classes for the cached /dist page."""
+    return jsonify(
+        ratings=load_ratings(),
+        threshold_classes=threshold_classes(_file_version(THRESHOLDS_FILE)),
+    )
 
-_legacy_counts_cache = None
 
 def get_legacy_2d_counts():
-    """Get counts at each (phash, dhash) point for the legacy hash distribution map."""
-    global _legacy_counts_cache
-    if _legacy_counts_cache is not None:
-        return _legacy_counts_cache
+    """Get counts at each (phash, dhash) point for the legacy hash distribution map.
 
-    # Use summary table if available (much faster)
+    Returns (cross_counts, same_counts, max_phash, max_dhash). The counts are
+    dense LEGACY_COUNTS_SHAPE int32 arrays indexed [phash_dist, dhash_dist],
+    filled only within the LEGACY_MAX_PHASH x LEGACY_MAX_DHASH range. The
+    maxima cover every pair, capped to that range, and are None with no pairs.
+    """
+    return load_legacy_2d_counts(_db_version())
+
+
+@functools.lru_cache(maxsize=2)
+def load_legacy_2d_counts(db_version: tuple[int, int]):
+    """Aggregate the legacy counts and distance bounds, once per database version."""
+    # Use summary table if available (much faster), else fall back to photo_pairs
     if has_summary_table():
-        conn = get_connection()
-        cursor = conn.execute("""
+        table = "pair_count_summary"
+        query = """
             SELECT phash_dist, dhash_dist, same_primary_group, SUM(count) as cnt
             FROM pair_count_summary
+            WHERE phash_dist <= ? AND dhash_dist <= ?
             GROUP BY phash_dist, dhash_dist, same_primary_group
-        """)
-        cross_counts = {}
-        same_counts = {}
-        for row in cursor.fetchall():
-            key = (row['phash_dist'], row['dhash_dist'])
-            if row['same_primary_group']:
-                same_counts[key] = row['cnt']
-            else:
-                cross_counts[key] = row['cnt']
-        conn.close()
-        _legacy_counts_cache = (cross_counts, same_counts)
-        return _legacy_counts_cache
-
-    # Fall back to photo_pairs table (slower)
-    if has_pairs_table():
-        conn = get_connection()
-        # Get both cross-group and same-group counts
-        cursor = conn.execute("""
+        """
+    elif has_pairs_table():
+        table = "photo_pairs"
+        query = """
             SELECT phash_dist, dhash_dist, same_primary_group, COUNT(*) as cnt
             FROM photo_pairs
+            WHERE phash_dist <= ? AND dhash_dist <= ?
             GROUP BY phash_dist, dhash_dist, same_primary_group
-        """)
-        cross_counts = {}
-        same_counts = {}
-        for row in cursor.fetchall():
-            key = (row['phash_dist'], row['dhash_dist'])
-            if row['same_primary_group']:
-                same_counts[key] = row['cnt']
-            else:
-                cross_counts[key] = row['cnt']
-        conn.close()
-        _legacy_counts_cache = (cross_counts, same_counts)
-        return _legacy_counts_cache
-    return {}, {}
+        """
+    else:
+        empty = np.zeros(LEGACY_COUNTS_SHAPE, dtype=np.int32)
+        return empty, empty, None, None
+
+    conn = get_read_connection()
+    # Separate subqueries so each MAX is a single index lookup
+    max_phash, max_dhash = conn.execute(f"""
+        SELECT MIN((SELECT MAX(phash_dist) FROM {table}), ?),
+               MIN((SELECT MAX(dhash_dist) FROM {table}), ?)
+    """, (LEGACY_MAX_PHASH, LEGACY_MAX_DHASH)).fetchone()
+    rows = conn.execute(query, (LEGACY_MAX_PHASH, LEGACY_MAX_DHASH)).fetchall()
+    rows = np.array(rows, dtype=np.int64).reshape(-1, 4)
+
+    cross_counts = np.zeros(LEGACY_COUNTS_SHAPE, dtype=np.int32)
+    same_counts = np.zeros(LEGACY_COUNTS_SHAPE, dtype=np.int32)
+    same = rows[:, 2] != 0
+    cross_counts[rows[~same, 0], rows[~same, 1]] = rows[~same, 3]
+    same_counts[rows[same, 0], rows[same, 1]] = rows[same, 3]
+    return cross_counts, same_counts, max_phash, max_dhash
 
 
 TEMPLATE_LEGACY_DIST = """
@@ -1422,25 +1715,18 @@ TEMPLATE_LEGACY_DIST = """
             <td class="header">{{ d }}</td>
             {% endfor %}
         </tr>
-        {% for p in range(min_phash, max_phash + 1) %}
+        {% for p, cells in cross_rows %}
         <tr>
             <td class="header">{{ p }}</td>
-            {% for d in range(max_dhash + 1) %}
-            {% set count = cross_counts.get((p, d), 0) %}
-            {% if count > 0 %}
-            <td class="heat-{{ [5, (count // 500) + 1] | min }}">
-                {{ count if count < 1000 else (count // 1000)|string + 'k' }}
-            </td>
-            {% else %}
-            <td class="heat-0">·</td>
-            {% endif %}
+            {% for text, cls in cells %}
+            <td class="{{ cls }}">{{ text }}</td>
             {% endfor %}
         </tr>
         {% endfor %}
     </table>
     </div>
 
-    {% if same_counts %}
+    {% if has_same %}
     <div class="table-section">
     <h3>Same-group pairs (blue = more pairs)</h3>
     <p style="color:#888;font-size:0.9em">Known duplicates - validates grouping thresholds</p>
@@ -1451,18 +1737,11 @@ TEMPLATE_LEGACY_DIST = """
             <td class="header">{{ d }}</td>
             {% endfor %}
         </tr>
-        {% for p in range(min_phash, max_phash + 1) %}
+        {% for p, cells in same_rows %}
         <tr>
             <td class="header">{{ p }}</td>
-            {% for d in range(max_dhash + 1) %}
-            {% set count = same_counts.get((p, d), 0) %}
-            {% if count > 0 %}
-            <td class="same-heat-{{ [5, (count // 50) + 1] | min }}">
-                {{ count if count < 1000 else (count // 1000)|string + 'k' }}
-            </td>
-            {% else %}
-            <td class="heat-0">·</td>
-            {% endif %}
+            {% for text, cls in cells %}
+            <td class="{{ cls }}">{{ text }}</td>
             {% endfor %}
         </tr>
         {% endfor %}
@@ -1474,48 +1753,86 @@ TEMPLATE_LEGACY_DIST = """
 </html>
 """
 
+_LEGACY_DIST_TEMPLATE = app.jinja_env.from_string(TEMPLATE_LEGACY_DIST)
+
+
+def legacy_heat_rows(counts, min_phash, max_phash, max_dhash, step, heat_prefix):
+    """Build (phash, [(text, class), ...]) rows for one legacy heatmap table.
+
+    Heat goes up one bucket per `step` pairs, capped at 5.
+    """
+    cap = 5 * step
+    rows = []
+    for p, row in enumerate(counts[min_phash:max_phash + 1, :max_dhash + 1].tolist(), min_phash):
+        cells = []
+        for count in row:
+            if not count:
+                cells.append(("·", "heat-0"))
+                continue
+            heat = 5 if count >= cap else count // step + 1
+            text = str(count) if count < 1000 else f"{count // 1000}k"
+            cells.append((text, f"{heat_prefix}-{heat}"))
+        rows.append((p, cells))
+    return rows
+
 
 @app.route('/legacy-dist')
 def show_legacy_distribution():
     """Show 2D distribution heatmap for legacy phash × dhash."""
-    cross_counts, same_counts = get_legacy_2d_counts()
-
-    if not cross_counts and not same_counts:
+    cross_counts, same_counts, max_phash, max_dhash = get_legacy_2d_counts()
+    if max_phash is None:
         return "No data yet. Run stage 1b first.", 200
 
-    all_keys = set(cross_counts.keys()) | set(same_counts.keys())
-    # Focus on the interesting range where grouping happens
+    # Counts only cover the interesting range where grouping happens
     min_phash = 0
-    max_phash = min(max(k[0] for k in all_keys), 30)  # Cap at 30
-    max_dhash = min(max(k[1] for k in all_keys), 35)  # Cap at 35
-
-    return render_template_string(
-        TEMPLATE_LEGACY_DIST,
-        cross_counts=cross_counts,
-        same_counts=same_counts,
-        min_phash=min_phash,
-        max_phash=max_phash,
+
+    # Stream rows as they render instead of building the whole page first
+    stream = _LEGACY_DIST_TEMPLATE.stream(
+        cross_rows=legacy_heat_rows(cross_counts, min_phash, max_phash, max_dhash, 500, "heat"),
+        same_rows=legacy_heat_rows(same_counts, min_phash, max_phash, max_dhash, 50, "same-heat"),
+        has_same=same_counts.any(),
         max_dhash=max_dhash,
     )
+    stream.enable_buffering(16)
+    return app.response_class(stream, mimetype='text/html')
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def get_image_info(photo_id: str) -> tuple[Path, str] | None:
+    """(file path, MIME type) of a photo, or None if unknown.
+
+    Neither changes once stored, so the lookup and path building happen
+    once per photo.
+    """
+    conn = get_read_connection()
+    row = conn.execute("SELECT mime_type FROM photos WHERE id = ?", (photo_id,)).fetchone()
+    if not row:
+        return None
+    return get_file_path(photo_id, row['mime_type']), row['mime_type']
 
 
 @app.route('/image/<photo_id>')
 def serve_image(photo_id):
     """Serve an image file."""
-    conn = get_connection()
-    cursor = conn.execute("SELECT mime_type FROM photos WHERE id = ?", (photo_id,))
-    row = cursor.fetchone()
-    conn.close()
-
-    if not row:
+    info = get_image_info(photo_id)
+    if info is None:
         return "Not found", 404
 
-    file_path = get_file_path(photo_id, row['mime_type'])
-    if not file_path.exists():
+    file_path, mime_type = info
+    # Photo IDs are content hashes, so they make a stable ETag and
+    # reloads get a 304 instead of the whole file. send_file stats the
+    # path itself (and takes Last-Modified from it), so no exists() check.
+    try:
+        return send_file(
+            file_path,
+            mimetype=mime_type,
+            conditional=True,
+            etag=photo_id,
+            max_age=86400,
+        )
+    except FileNotFoundError:
         return "File not found", 404
 
-    return send_file(file_path, mimetype=row['mime_type'])
-
 
 if __name__ == '__main__':
     print(f"Database: {DB_PATH}")
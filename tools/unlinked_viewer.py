@@ -14,9 +14,10 @@ hamming distances.
 """
 
 import sqlite3
+from collections import defaultdict
 from pathlib import Path
 
-from flask import Flask, render_template_string, send_file, request
+from flask import Flask, send_file, request
 
 # Paths
 DB_PATH = Path(__file__).parent.parent / "output" / "photos.db"
@@ -36,10 +37,49 @@ MIME_TO_EXT = {
 }
 
 
-def get_connection():
+_read_conn = None
+
+
+def get_read_connection():
+    """Query-only connection shared by all request threads.
+
+    The dev server starts a thread per request, so per-request connections
+    were opened and torn down for every page and image. Callers must not
+    close it.
+    """
+    global _read_conn
+    if _read_conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = 1")
+        _read_conn = conn
+    return _read_conn
+
+
+def ensure_unlinked_index():
+    """Create idx_unlinked_dist if the database predates it.
+
+    Stage 4 creates the index, but databases grouped before it was added
+    won't have one, and stage 4 shouldn't be re-run just for that. Without
+    it every page sorts the whole unlinked_pairs table. Uses a short-lived
+    connection of its own; if the database can't be written the viewer
+    still works, only slower.
+    """
+    # Checked before the shared read connection caches the schema
     conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    try:
+        if conn.execute("""
+            SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_unlinked_dist'
+        """).fetchone():
+            return
+        print("Warning: idx_unlinked_dist is missing, creating it")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_unlinked_dist ON unlinked_pairs(phash_dist, dhash_dist)"
+        )
+    except sqlite3.OperationalError as e:
+        print(f"Warning: couldn't create idx_unlinked_dist ({e}), every page will scan unlinked_pairs")
+    finally:
+        conn.close()
 
 
 def get_file_path(photo_id: str, mime_type: str) -> Path:
@@ -47,20 +87,16 @@ def get_file_path(photo_id: str, mime_type: str) -> Path:
     return FILES_DIR / photo_id[:2] / f"{photo_id}{ext}"
 
 
-def hamming_distance(hash1: str, hash2: str) -> int:
-    """Calculate hamming distance between two hex hash strings."""
-    xor = int(hash1, 16) ^ int(hash2, 16)
-    return bin(xor).count("1")
+# Grouping thresholds
+PHASH_SAFE_GROUP = 10
+PHASH_BORDERLINE_12 = 12
+PHASH_BORDERLINE_14 = 14
+DHASH_EXCLUDE_AT_12 = 22
+DHASH_INCLUDE_AT_14 = 17
 
 
 def should_group(phash_dist: int, dhash_dist: int) -> bool:
     """Determine if two photos should be grouped based on thresholds."""
-    PHASH_SAFE_GROUP = 10
-    PHASH_BORDERLINE_12 = 12
-    PHASH_BORDERLINE_14 = 14
-    DHASH_EXCLUDE_AT_12 = 22
-    DHASH_INCLUDE_AT_14 = 17
-
     if phash_dist <= PHASH_SAFE_GROUP:
         return True
     elif phash_dist <= PHASH_BORDERLINE_12:
@@ -71,48 +107,118 @@ def should_group(phash_dist: int, dhash_dist: int) -> bool:
         return False
 
 
-def get_unlinked_pairs():
-    """Get all unlinked pairs ordered by distance."""
-    conn = get_connection()
+UNLINKED_PAIR_QUERY = """
+    SELECT
+        up.rowid, up.photo_id_1, up.photo_id_2,
+        up.phash_dist, up.dhash_dist, up.reason,
+        p1.width as w1, p1.height as h1,
+        p2.width as w2, p2.height as h2,
+        dg1.group_id as group1,
+        dg2.group_id as group2
+    FROM unlinked_pairs up
+    JOIN photos p1 ON up.photo_id_1 = p1.id
+    JOIN photos p2 ON up.photo_id_2 = p2.id
+    LEFT JOIN duplicate_groups dg1 ON up.photo_id_1 = dg1.photo_id
+    LEFT JOIN duplicate_groups dg2 ON up.photo_id_2 = dg2.photo_id
+"""
+
+
+def get_pair_and_next(idx: int, direction: str | None = None,
+                      key: tuple[int, int, int] | None = None) -> tuple[dict | None, dict | None]:
+    """Get the pair to show and the one after it, in a single query.
+
+    Prev/next links pass the (phash_dist, dhash_dist, rowid) key of the
+    pair they came from, which seeks through idx_unlinked_dist so a step
+    costs the same anywhere in the list. Going back, the pair we came
+    from is the next one, so the seek includes it. Jumps, and keys that
+    no longer match, fall back to the idx-th pair by OFFSET.
+    """
+    conn = get_read_connection()
+    rows = []
+    if direction == "after":
+        rows = conn.execute(UNLINKED_PAIR_QUERY + """
+            WHERE (up.phash_dist, up.dhash_dist, up.rowid) > (?, ?, ?)
+            ORDER BY up.phash_dist, up.dhash_dist, up.rowid
+            LIMIT 2
+        """, key).fetchall()
+    elif direction == "before":
+        rows = conn.execute(UNLINKED_PAIR_QUERY + """
+            WHERE (up.phash_dist, up.dhash_dist, up.rowid) <= (?, ?, ?)
+            ORDER BY up.phash_dist DESC, up.dhash_dist DESC, up.rowid DESC
+            LIMIT 2
+        """, key).fetchall()[::-1]
+        if len(rows) < 2 or (rows[1]['phash_dist'], rows[1]['dhash_dist'], rows[1]['rowid']) != key:
+            rows = []
+    if not rows:
+        rows = conn.execute(UNLINKED_PAIR_QUERY + """
+            ORDER BY up.phash_dist, up.dhash_dist, up.rowid
+            LIMIT 2 OFFSET ?
+        """, (idx,)).fetchall()
+    rows = [dict(row) for row in rows] + [None, None]
+    return rows[0], rows[1]
+
+
+def get_unlinked_counts() -> dict[str, int]:
+    """Count unlinked pairs by reason."""
+    conn = get_read_connection()
     cursor = conn.execute("""
-        SELECT
-            up.photo_id_1, up.photo_id_2,
-            up.phash_dist, up.dhash_dist, up.reason,
-            p1.mime_type as mime1, p1.width as w1, p1.height as h1,
-            p1.perceptual_hash as phash1, p1.dhash as dhash1,
-            p2.mime_type as mime2, p2.width as w2, p2.height as h2,
-            p2.perceptual_hash as phash2, p2.dhash as dhash2,
-            dg1.group_id as group1,
-            dg2.group_id as group2
+        SELECT up.reason, COUNT(*) as cnt
         FROM unlinked_pairs up
         JOIN photos p1 ON up.photo_id_1 = p1.id
         JOIN photos p2 ON up.photo_id_2 = p2.id
-        LEFT JOIN duplicate_groups dg1 ON up.photo_id_1 = dg1.photo_id
-        LEFT JOIN duplicate_groups dg2 ON up.photo_id_2 = dg2.photo_id
-        ORDER BY up.phash_dist, up.dhash_dist
+        GROUP BY up.reason
     """)
-    pairs = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return pairs
+    counts = {row['reason']: row['cnt'] for row in cursor.fetchall()}
+    return counts
+
+
+def distance_class(dist: int, good: int, warn: int) -> str:
+    """CSS class for a distance: good up to `good`, warn up to `warn`, else bad."""
+    if dist <= good:
+        return "good"
+    if dist <= warn:
+        return "warn"
+    return "bad"
+
+
+_groups = None
+
+
+def get_groups() -> dict[int, list[dict]]:
+    """All grouped photos with their hashes by group_id, largest first, loaded once.
+
+    'hashes' holds (phash, dhash) parsed from hex, or None if either is missing.
+    """
+    global _groups
+    # Requests are threaded, so only publish the map once it is complete
+    groups = _groups
+    if groups is None:
+        conn = get_read_connection()
+        cursor = conn.execute("""
+            SELECT
+                dg.group_id, p.id, p.mime_type, p.width, p.height,
+                p.perceptual_hash, p.dhash
+            FROM duplicate_groups dg
+            JOIN photos p ON dg.photo_id = p.id
+            ORDER BY dg.group_id, (p.width * p.height) DESC
+        """)
+        members = defaultdict(list)
+        for row in cursor:
+            photo = dict(row)
+            if photo['perceptual_hash'] and photo['dhash']:
+                photo['hashes'] = (int(photo['perceptual_hash'], 16), int(photo['dhash'], 16))
+            else:
+                photo['hashes'] = None
+            members[photo.pop('group_id')].append(photo)
+        groups = _groups = dict(members)
+    return groups
 
 
 def get_group_photos(group_id: int) -> list[dict]:
     """Get all photos in a group with their hashes."""
     if group_id is None:
         return []
-    conn = get_connection()
-    cursor = conn.execute("""
-        SELECT
-            p.id, p.mime_type, p.width, p.height,
-            p.perceptual_hash, p.dhash
-        FROM duplicate_groups dg
-        JOIN photos p ON dg.photo_id = p.id
-        WHERE dg.group_id = ?
-        ORDER BY (p.width * p.height) DESC
-    """, (group_id,))
-    photos = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return photos
+    return get_groups().get(group_id, [])
 
 
 def get_all_blocking_pairs(group1_id: int, group2_id: int) -> list[dict]:
@@ -125,27 +231,29 @@ def get_all_blocking_pairs(group1_id: int, group2_id: int) -> list[dict]:
     if group1_id is None or group2_id is None:
         return []
 
-    group1_photos = get_group_photos(group1_id)
-    group2_photos = get_group_photos(group2_id)
+    group1_photos = [p for p in get_group_photos(group1_id) if p['hashes']]
+    group2_photos = [p for p in get_group_photos(group2_id) if p['hashes']]
     blocking = []
 
     for p1 in group1_photos:
-        if not p1['perceptual_hash'] or not p1['dhash']:
-            continue
+        phash1, dhash1 = p1['hashes']
         for p2 in group2_photos:
-            if not p2['perceptual_hash'] or not p2['dhash']:
+            phash2, dhash2 = p2['hashes']
+            phash_dist = (phash1 ^ phash2).bit_count()
+            # Grouped whatever the dhash, so never a blocker
+            if phash_dist <= PHASH_SAFE_GROUP:
                 continue
-
-            phash_dist = hamming_distance(p1['perceptual_hash'], p2['perceptual_hash'])
-            dhash_dist = hamming_distance(p1['dhash'], p2['dhash'])
+            dhash_dist = (dhash1 ^ dhash2).bit_count()
 
             if not should_group(phash_dist, dhash_dist):
                 blocking.append({
                     'photo1_id': p1['id'],
+                    'photo1_short': p1['id'][:20],
                     'photo1_mime': p1['mime_type'],
                     'photo1_width': p1['width'],
                     'photo1_height': p1['height'],
                     'photo2_id': p2['id'],
+                    'photo2_short': p2['id'][:20],
                     'photo2_mime': p2['mime_type'],
                     'photo2_width': p2['width'],
                     'photo2_height': p2['height'],
@@ -163,6 +271,10 @@ TEMPLATE = """
 <html>
 <head>
     <title>Unlinked Pairs Viewer</title>
+    {% if next_pair %}
+    <link rel="preload" as="image" href="/image/{{ next_pair.photo_id_1 }}">
+    <link rel="preload" as="image" href="/image/{{ next_pair.photo_id_2 }}">
+    {% endif %}
     <style>
         * { box-sizing: border-box; }
         html, body { height: 100%; margin: 0; }
@@ -220,11 +332,11 @@ TEMPLATE = """
     <div class="header">
         <div class="nav">
             {% if prev_idx is not none %}
-            <a id="prev" href="/pair/{{ prev_idx }}">&larr; Prev</a>
+            <a id="prev" href="/pair/{{ prev_idx }}/before/{{ pair.phash_dist }}/{{ pair.dhash_dist }}/{{ pair.rowid }}">&larr; Prev</a>
             {% endif %}
             <span>Pair {{ idx + 1 }} / {{ total }}</span>
             {% if next_idx is not none %}
-            <a id="next" href="/pair/{{ next_idx }}">Next &rarr;</a>
+            <a id="next" href="/pair/{{ next_idx }}/after/{{ pair.phash_dist }}/{{ pair.dhash_dist }}/{{ pair.rowid }}">Next &rarr;</a>
             {% endif %}
         </div>
         <form class="jump-form" action="/jump" method="get">
@@ -238,11 +350,11 @@ TEMPLATE = """
     <div class="pair-info">
         <div class="item">
             <div class="label">pHash Distance</div>
-            <div class="value {% if pair.phash_dist <= 10 %}good{% elif pair.phash_dist <= 14 %}warn{% else %}bad{% endif %}">{{ pair.phash_dist }}</div>
+            <div class="value {{ pair.phash_class }}">{{ pair.phash_dist }}</div>
         </div>
         <div class="item">
             <div class="label">dHash Distance</div>
-            <div class="value {% if pair.dhash_dist <= 17 %}good{% elif pair.dhash_dist <= 22 %}warn{% else %}bad{% endif %}">{{ pair.dhash_dist }}</div>
+            <div class="value {{ pair.dhash_class }}">{{ pair.dhash_dist }}</div>
         </div>
         <div class="item">
             <div class="label">Reason</div>
@@ -266,7 +378,7 @@ TEMPLATE = """
                     <img src="/image/{{ pair.photo_id_1 }}">
                 </div>
                 <div class="photo-info">
-                    <div class="id">{{ pair.photo_id_1[:24] }}...</div>
+                    <div class="id">{{ pair.id1_short }}...</div>
                     <div class="dims">{{ pair.w1 }}x{{ pair.h1 }}</div>
                     {% if pair.group1 is not none %}
                     <div class="group-link">In group <a href="http://localhost:5001/group/{{ pair.group1 }}">{{ pair.group1 }}</a></div>
@@ -281,7 +393,7 @@ TEMPLATE = """
                     <img src="/image/{{ pair.photo_id_2 }}">
                 </div>
                 <div class="photo-info">
-                    <div class="id">{{ pair.photo_id_2[:24] }}...</div>
+                    <div class="id">{{ pair.id2_short }}...</div>
                     <div class="dims">{{ pair.w2 }}x{{ pair.h2 }}</div>
                     {% if pair.group2 is not none %}
                     <div class="group-link">In group <a href="http://localhost:5001/group/{{ pair.group2 }}">{{ pair.group2 }}</a></div>
@@ -301,9 +413,9 @@ TEMPLATE = """
                 {% for bp in blocking_pairs %}
                 <div class="blocking-pair">
                     <div class="bp-photos">
-                        <img src="/image/{{ bp.photo1_id }}" title="{{ bp.photo1_id[:20] }}...">
+                        <img src="/image/{{ bp.photo1_id }}" title="{{ bp.photo1_short }}...">
                         <span class="bp-arrow">↔</span>
-                        <img src="/image/{{ bp.photo2_id }}" title="{{ bp.photo2_id[:20] }}...">
+                        <img src="/image/{{ bp.photo2_id }}" title="{{ bp.photo2_short }}...">
                     </div>
                     <div class="bp-info">
                         <div class="distances">pHash: {{ bp.phash_dist }}, dHash: {{ bp.dhash_dist }}</div>
@@ -339,14 +451,18 @@ TEMPLATE = """
 </html>
 """
 
-_pairs = None
+# Compiled once; render_template_string re-parses the source on every call
+_TEMPLATE = app.jinja_env.from_string(TEMPLATE)
+
+_total = None
 
 
-def get_pairs():
-    global _pairs
-    if _pairs is None:
-        _pairs = get_unlinked_pairs()
-    return _pairs
+def get_total() -> int:
+    """Number of unlinked pairs, counted once until /reload."""
+    global _total
+    if _total is None:
+        _total = sum(get_unlinked_counts().values())
+    return _total
 
 
 @app.route('/')
@@ -358,74 +474,95 @@ def index():
 def jump():
     """Jump to a specific pair by index."""
     idx = int(request.args.get('idx', 1)) - 1
-    pairs = get_pairs()
-    if 0 <= idx < len(pairs):
+    if 0 <= idx < get_total():
         return app.redirect(f'/pair/{idx}')
     return app.redirect('/')
 
 
 @app.route('/pair/<int:idx>')
-def show_pair(idx):
-    pairs = get_pairs()
-    if not pairs:
+@app.route('/pair/<int:idx>/<any(after, before):direction>/<int:phash>/<int:dhash>/<int:rowid>')
+def show_pair(idx, direction=None, phash=None, dhash=None, rowid=None):
+    total = get_total()
+    if not total:
         return "No unlinked pairs found"
 
-    idx = max(0, min(idx, len(pairs) - 1))
-    pair = pairs[idx]
+    idx = max(0, min(idx, total - 1))
+    # The next pair's images are preloaded while this page is viewed
+    pair, next_pair = get_pair_and_next(idx, direction, (phash, dhash, rowid))
+    if pair is None:
+        return "Pair not found - try /reload", 404
 
     prev_idx = idx - 1 if idx > 0 else None
-    next_idx = idx + 1 if idx < len(pairs) - 1 else None
+    next_idx = idx + 1 if idx < total - 1 else None
+
+    pair['id1_short'] = pair['photo_id_1'][:24]
+    pair['id2_short'] = pair['photo_id_2'][:24]
+    pair['phash_class'] = distance_class(pair['phash_dist'], 10, 14)
+    pair['dhash_class'] = distance_class(pair['dhash_dist'], 17, 22)
 
     # Find all blocking pairs between the two groups
     blocking_pairs = get_all_blocking_pairs(pair['group1'], pair['group2'])
 
-    return render_template_string(
-        TEMPLATE,
+    return _TEMPLATE.render(
         pair=pair,
         idx=idx,
-        total=len(pairs),
+        total=total,
         prev_idx=prev_idx,
         next_idx=next_idx,
+        next_pair=next_pair,
         blocking_pairs=blocking_pairs,
     )
 
 
+_mime_types = None
+
+
+def get_mime_types() -> dict[str, str]:
+    """MIME type of every photo by id, loaded in one query."""
+    global _mime_types
+    if _mime_types is None:
+        conn = get_read_connection()
+        _mime_types = dict(conn.execute("SELECT id, mime_type FROM photos").fetchall())
+    return _mime_types
+
+
 @app.route('/image/<photo_id>')
 def serve_image(photo_id):
-    conn = get_connection()
-    cursor = conn.execute("SELECT mime_type FROM photos WHERE id = ?", (photo_id,))
-    row = cursor.fetchone()
-    conn.close()
-
-    if not row:
+    mime_type = get_mime_types().get(photo_id)
+    if mime_type is None:
         return "Not found", 404
 
-    file_path = get_file_path(photo_id, row['mime_type'])
-    if not file_path.exists():
+    file_path = get_file_path(photo_id, mime_type)
+    # Photo IDs are content hashes, so they make a stable ETag
+    try:
+        return send_file(
+            file_path,
+            mimetype=mime_type,
+            conditional=True,
+            etag=photo_id,
+            max_age=86400,
+        )
+    except FileNotFoundError:
         return "File not found", 404
 
-    return send_file(file_path, mimetype=row['mime_type'])
-
 
 @app.route('/reload')
 def reload_data():
     """Reload pairs from database."""
-    global _pairs
-    _pairs = None
+    global _total, _groups, _mime_types
+    _total = None
+    _groups = None
+    _mime_types = None
     return app.redirect('/')
 
 
 if __name__ == '__main__':
-    pairs = get_pairs()
+    ensure_unlinked_index()
+    reasons = get_unlinked_counts()
     print(f"Database: {DB_PATH}")
-    print(f"Unlinked pairs: {len(pairs):,}")
-    if pairs:
-        # Count by reason
-        reasons = {}
-        for p in pairs:
-            reasons[p['reason']] = reasons.get(p['reason'], 0) + 1
-        for reason, count in sorted(reasons.items()):
-            print(f"  {reason}: {count:,}")
+    print(f"Unlinked pairs: {sum(reasons.values()):,}")
+    for reason, count in sorted(reasons.items()):
+        print(f"  {reason}: {count:,}")
     print()
     print("Starting server at http://localhost:5002")
     print("Pairs are sorted by distance (closest first)")